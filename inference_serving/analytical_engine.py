@@ -0,0 +1,124 @@
+import heapq
+from .utils import *
+from .generate_trace import get_trace_layers, get_batch_attn, get_draft_steps
+
+# runs iterations without AnalyticalAstra, latency of a batch is computed from the perf model
+# only single NPU or pure tensor parallelism (npu_group == 1): every NPU runs the whole batch in lockstep
+# it follows the protocol of AnalyticalAstra: each NPU reports (sys, iteration id, cycle) when it finishes an iteration
+class AnalyticalEngine():
+    def __init__(self, hardware, npu_num, npu_group, local_bw, remote_bw, link_bw, link_latency, interp='linear', verbose=False):
+        self.hardware = hardware
+        self.npu_num = npu_num
+        self.npu_group = npu_group
+        # bandwidths in GB/s are bytes per ns
+        self.local_bw = local_bw
+        self.remote_bw = remote_bw
+        self.link_bw = link_bw
+        self.link_latency = link_latency
+        self.interp = interp
+        self.verbose = verbose
+        self.tp = npu_num != npu_group
+
+        self.now = 0
+        self.events = [] # (cycle, sys, iteration id)
+        self.waked = False # woke up without any batch to run
+
+    # time of a ring ALLREDUCE of size bytes among the NPUs
+    def get_allreduce_latency(self, size):
+        n = self.npu_num
+        if n == 1 or size == 0:
+            return 0
+        return 2 * (n - 1) / n * size / self.link_bw + 2 * (n - 1) * self.link_latency
+
+    # time of one layer on an NPU, compute and memory are split evenly under tensor parallelism
+    def get_layer_latency(self, layer):
+        _, latency, input_size, weight_size, output_size, comm_type, comm_size = layer
+        shard = self.npu_num if self.tp else 1
+        comp = latency / shard
+        mem = (input_size + weight_size + output_size) / shard / self.local_bw
+        comm = 0
+        if comm_type == 'ALLREDUCE':
+            comm = self.get_allreduce_latency(comm_size)
+        return max(comp, mem) + comm
+
+    # latency of one iteration of the batch in ns
+    def get_iteration_latency(self, batch):
+        attn, init, prefilled = get_batch_attn(batch)
+        latency = self.get_model_latency(batch.model, batch.input, attn, init, prefilled, batch.kv_dtype)
+        # speculative decoding: steps of the draft model
+        for total_len, draft_attn, draft_init, draft_prefilled in get_draft_steps(batch):
+            latency += self.get_model_latency(batch.draft_model, total_len, draft_attn, draft_init, draft_prefilled, batch.kv_dtype)
+
+        # vllm: kv cache of each NPU is loaded from and evicted to remote memory
+        latency += (batch.load + batch.evict) / self.remote_bw
+        # tiered kv store: reads from the SSD before the kv cache is loaded
+        latency += batch.kv_delay
+        return int(latency)
+
+    # latency of one forward pass of the model in ns
+    def get_model_latency(self, model, total_len, attn, init, prefilled, kv_dtype=None):
+        head, block, tail = get_trace_layers(self.hardware, model, total_len, attn, init, self.tp, self.interp, prefilled, kv_dtype)
+        config = get_config(model)
+
+        latency = 0
+        for layer in head + tail:
+            latency += self.get_layer_latency(layer)
+        block_latency = 0
+        for layer in block:
+            if not isinstance(layer, str):
+                block_latency += self.get_layer_latency(layer)
+        latency += block_latency * config['num_hidden_layers']
+        return latency
+
+    # every NPU reports at the first arrival, like the event handler of AnalyticalAstra
+    def start(self, alarm):
+        self.now = alarm
+        for sys in range(self.npu_num):
+            heapq.heappush(self.events, (alarm, sys, 0))
+
+    # next finished iteration as (sys, iteration id, cycle)
+    # when every NPU is idle, NPU 0 wakes up at the next arrival
+    def wait(self, scheduler):
+        if len(self.events) == 0:
+            alarm = self.now
+            if not scheduler.is_request_empty() and len(scheduler.inflight) == 0:
+                alarm = max(self.now, scheduler.get_first_arrival_time())
+                if alarm == self.now and self.waked:
+                    print("ERROR: AnalyticalEngine: requests are waiting but no batch can be scheduled")
+                    return None
+            self.wake(alarm)
+        return self.pop()
+
+    # wake NPU 0 up when the scheduler has requests but nothing runs
+    # after a wake up that could not schedule anything, it sleeps until waked is reset
+    def wake_idle(self, scheduler, now):
+        if len(self.events) == 0 and not self.waked and len(scheduler.inflight) == 0 and scheduler.get_num_request() != 0:
+            self.wake(max(now, scheduler.get_first_arrival_time()))
+
+    # NPU 0 wakes up at alarm to schedule a batch
+    def wake(self, alarm):
+        self.waked = True
+        heapq.heappush(self.events, (alarm, 0, 0))
+
+    # cycle of the next event, None if there is no event
+    def get_next_time(self):
+        return self.events[0][0] if len(self.events) != 0 else None
+
+    # pop the next event as (sys, iteration id, cycle)
+    def pop(self):
+        cycle, sys, id = heapq.heappop(self.events)
+        self.now = cycle
+        return sys, id, cycle
+
+    # run the batch on the NPU, None if there is nothing to run
+    def submit(self, sys, batch):
+        if batch == None:
+            return
+        self.waked = False
+        # the first NPU fires the batch on every NPU
+        if sys == 0:
+            latency = self.get_iteration_latency(batch)
+            if self.verbose:
+                print(f"AnalyticalEngine: batch #{batch.batch_id} takes {latency} ns")
+            for npu in range(self.npu_num):
+                heapq.heappush(self.events, (self.now + latency, npu, batch.batch_id + 1))
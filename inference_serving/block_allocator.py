@@ -0,0 +1,61 @@
+# paged kv cache of an NPU, vLLM style
+# a fixed pool of blocks, a free list and a block table of each owner (a request, or the prefix cache for shared blocks)
+# a block is allocated or freed in O(1), blocks of a table are in token order
+class BlockAllocator():
+    def __init__(self, num_blocks, block_size):
+        self.num_blocks = num_blocks
+        self.block_size = block_size
+        self.free_list = list(range(num_blocks - 1, -1, -1)) # block 0 is allocated first
+        self.tables = {} # owner -> list of block ids
+        self.peak = 0 # most blocks in use
+
+    def get_num_free(self):
+        return len(self.free_list)
+
+    def get_num_used(self):
+        return self.num_blocks - len(self.free_list)
+
+    def get_table(self, owner):
+        return self.tables.get(owner, [])
+
+    # append num blocks to the table of the owner, returns False if the pool has not enough free blocks
+    def allocate(self, owner, num):
+        if num <= 0:
+            return True
+        if num > len(self.free_list):
+            print(f"ERROR: BlockAllocator: no free block to allocate {num} blocks, {len(self.free_list)} free")
+            return False
+        table = self.tables.setdefault(owner, [])
+        for _ in range(num):
+            table.append(self.free_list.pop())
+        self.peak = max(self.peak, self.get_num_used())
+        return True
+
+    # free num blocks of the owner (all by default), the last ones unless front, returns the number of freed blocks
+    def release(self, owner, num=None, front=False):
+        table = self.tables.get(owner)
+        if table == None:
+            return 0
+        if num == None or num >= len(table):
+            blocks = table
+            del self.tables[owner]
+        elif front:
+            blocks = table[:num]
+            del table[:num]
+        else:
+            blocks = table[len(table) - num:]
+            del table[len(table) - num:]
+        self.free_list.extend(blocks)
+        return len(blocks)
+
+    # hand the first num blocks of the owner over to new_owner, returns the number of moved blocks
+    def move(self, owner, new_owner, num):
+        table = self.tables.get(owner)
+        if table == None or num <= 0:
+            return 0
+        blocks = table[:num]
+        del table[:num]
+        if len(table) == 0:
+            del self.tables[owner]
+        self.tables.setdefault(new_owner, []).extend(blocks)
+        return len(blocks)
@@ -0,0 +1,105 @@
+import numpy as np
+
+# data parallel replicas of the model behind a router, on the analytical engine
+# each replica has its own Scheduler (and MemoryModel) and AnalyticalEngine, all on one clock
+# requests arrive at the front scheduler, which only holds them until the router dispatches them on arrival
+class ReplicaCluster():
+    def __init__(self, front, replicas, engines, router, verbose=False):
+        self.front = front
+        self.replicas = replicas
+        self.engines = engines
+        self.router = router
+        self.verbose = verbose
+
+        self.now = 0
+        self.routed = [0] * len(replicas) # # of requests routed to each replica
+        # statistics
+        self.total_prompt = 0
+        self.total_gen = 0
+
+    # run all requests of the front scheduler, returns False if requests are stuck
+    def run(self):
+        total = self.front.get_num_request()
+        while sum(len(replica.done) + len(replica.rejected) for replica in self.replicas) < total:
+            for replica, engine in zip(self.replicas, self.engines):
+                engine.wake_idle(replica, self.now)
+            times = [self.front.get_next_arrival()] + [engine.get_next_time() for engine in self.engines]
+            if all(time == None for time in times):
+                print("ERROR: ReplicaCluster: requests are waiting but no batch can be scheduled")
+                return False
+            # arrivals first, then replicas in order at the same time
+            first = min((time, i) for i, time in enumerate(times) if time != None)[1]
+
+            if first == 0:
+                self.dispatch()
+                continue
+
+            replica, engine = self.replicas[first - 1], self.engines[first - 1]
+            sys, id, current = engine.pop()
+            self.now = current
+            prompt_t, gen_t, _ = replica.add_done(id, sys, current)
+            self.total_prompt += prompt_t
+            self.total_gen += gen_t
+            engine.submit(sys, replica.schedule(current, sys, id))
+        return True
+
+    # route the next arriving request
+    def dispatch(self):
+        req = self.front.pop_arrived()
+        self.now = max(self.now, req.arrival)
+        i = self.router.route(req, self.replicas)
+        self.replicas[i].enqueue(req, self.now)
+        self.engines[i].waked = False
+        self.routed[i] += 1
+        if self.verbose:
+            print(f"ReplicaCluster: routing the request #{req.id} to replica {i}")
+
+    def get_done(self):
+        return sorted([req for replica in self.replicas for req in replica.done], key=lambda x : x.id)
+
+    # all kv cache of every replica is freed
+    def is_memory_freed(self):
+        for replica in self.replicas:
+            memory = replica.memory
+            memory.evict_prefix_cache(memory.get_prefix_cache_size())
+            if memory.weight != memory.used_mem:
+                return False
+        return True
+
+    def print_result(self):
+        FREQ = 1000000000 # 1 GHz
+        done = self.get_done()
+        for req in done:
+            print(req)
+        total_latency = self.now / FREQ
+        print('---------------------------')
+        print('Throughput Results')
+        print('---------------------------')
+        print(f"Total prompts: {self.total_prompt} tokens")
+        print(f"Total generation: {self.total_gen} tokens")
+        print(f"Total clocks: {self.now} ticks")
+        print(f"Total latency: {total_latency:.3f} s")
+        if total_latency > 0:
+            print(f"Average prompt throughput: {self.total_prompt/total_latency:.3f} token/s")
+            print(f"Average generation throughput: {self.total_gen/total_latency:.3f} token/s")
+            print(f"Requests per second: {len(done)/total_latency:.3f} request/s")
+        print('---------------------------')
+        print(f'Cluster Results ({self.router.name} router)')
+        print('---------------------------')
+        for i, replica in enumerate(self.replicas):
+            utilization, peak, _ = replica.memory.get_block_stats()
+            print(f"Replica {i}: {self.routed[i]} requests routed, {len(replica.done)} done, {len(replica.rejected)} rejected, {utilization*100:.2f}% mean / {peak*100:.2f}% peak kv block utilization")
+        if len(done) != 0:
+            latency = np.array([req.latency for req in done], dtype=np.float64) / 1e6
+            ttft = np.array([req.ttft for req in done], dtype=np.float64) / 1e6
+            tpot = np.array([req.tpot for req in done], dtype=np.float64) / 1e6
+            print(f"Latency: mean {latency.mean():.3f} ms, p50 {np.percentile(latency, 50):.3f} ms, p99 {np.percentile(latency, 99):.3f} ms")
+            print(f"TTFT: mean {ttft.mean():.3f} ms, p99 {np.percentile(ttft, 99):.3f} ms")
+            print(f"TPOT: mean {tpot.mean():.3f} ms, p99 {np.percentile(tpot, 99):.3f} ms")
+            good = sum(replica.good for replica in self.replicas)
+            if total_latency > 0 and self.front.slo_requests > 0:
+                print(f"Goodput: {good/total_latency:.3f} request/s ({good} of {len(done)} requests meet the SLO)")
+        print('---------------------------')
+
+    def save_output(self, output_file):
+        self.front.save_output(output_file, self.get_done())
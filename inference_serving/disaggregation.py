@@ -0,0 +1,157 @@
+import heapq
+from collections import deque
+import numpy as np
+
+# disaggregated prefill/decode serving (DistServe, Splitwise) on the analytical engine
+# the prefill pool and the decode pool have their own Scheduler (and MemoryModel) and AnalyticalEngine
+# after prefill, the kv cache of a request is sent to the decode pool over the link (link_bw, link_latency)
+# decode memory is reserved before the transfer starts, prefill memory is freed when it ends
+class DisaggregatedServing():
+    def __init__(self, prefill, decode, prefill_engine, decode_engine, link_bw, link_latency, verbose=False):
+        self.prefill = prefill
+        self.decode = decode
+        self.prefill_engine = prefill_engine
+        self.decode_engine = decode_engine
+        # bandwidth in GB/s is bytes per ns
+        self.link_bw = link_bw
+        self.link_latency = link_latency
+        self.verbose = verbose
+        self.prefill.handoff = []
+
+        self.now = 0
+        self.queued = deque() # (request, handoff time) waiting for decode memory
+        self.transfers = [] # heap of (end, id, request) on the link
+        self.link_free = 0 # the link is busy until this time, transfers are serialized
+        # statistics
+        self.total_prompt = 0
+        self.total_gen = 0
+        self.transferred = 0 # kv cache bytes sent over the link
+        self.transfer_times = [] # handoff to arrival at the decode pool, includes waiting for memory
+
+    # run all requests of the prefill scheduler, returns False if requests are stuck
+    def run(self):
+        total = self.prefill.get_num_request()
+        if total == 0:
+            return True
+        self.prefill_engine.wake(self.prefill.get_first_arrival_time())
+
+        while len(self.prefill.done) + len(self.decode.done) + len(self.prefill.rejected) < total:
+            # a pool that could not schedule anything stays asleep until a transfer ends
+            self.prefill_engine.wake_idle(self.prefill, self.now)
+            self.decode_engine.wake_idle(self.decode, self.now)
+            times = [self.get_transfer_time(), self.prefill_engine.get_next_time(), self.decode_engine.get_next_time()]
+            if all(time == None for time in times):
+                print("ERROR: DisaggregatedServing: requests are waiting but no batch can be scheduled")
+                return False
+            # transfers first, then prefill, then decode at the same time
+            first = min((time, i) for i, time in enumerate(times) if time != None)[1]
+
+            if first == 0:
+                self.finish_transfer()
+                continue
+
+            scheduler, engine = (self.prefill, self.prefill_engine) if first == 1 else (self.decode, self.decode_engine)
+            sys, id, current = engine.pop()
+            self.now = current
+            prompt_t, gen_t, _ = scheduler.add_done(id, sys, current)
+            self.total_prompt += prompt_t
+            self.total_gen += gen_t
+            if first == 1:
+                self.handoff()
+            # decode memory may have been freed
+            self.start_transfers()
+            engine.submit(sys, scheduler.schedule(current, sys, id))
+        return True
+
+    def get_transfer_time(self):
+        return self.transfers[0][0] if len(self.transfers) != 0 else None
+
+    # requests that finished prefill wait for the decode memory
+    def handoff(self):
+        for req in self.prefill.handoff:
+            # shared prefix blocks stay in the prefill pool, the decode pool gets a full copy
+            if self.prefill.memory.prefix_cache != None:
+                self.prefill.memory.prefix_cache.release(req)
+            self.queued.append((req, self.now))
+        self.prefill.handoff.clear()
+        self.start_transfers()
+
+    # send queued kv caches in order while the decode pool has memory for them
+    def start_transfers(self):
+        while len(self.queued) != 0:
+            req, handoff = self.queued[0]
+            decode_size = self.decode.memory.get_evict_kv(req)
+            if self.decode.memory.npu_mem - self.decode.memory.used_mem < decode_size:
+                break
+            self.queued.popleft()
+            self.decode.memory.allocate(req)
+            # NPUs of a pool send or receive their shards in parallel, the slower side bounds the transfer
+            link_size = max(self.prefill.memory.get_evict_kv(req), decode_size)
+            start = max(self.now, self.link_free)
+            end = start + int(link_size / self.link_bw) + self.link_latency
+            self.link_free = end
+            self.transferred += link_size
+            self.transfer_times.append(end - handoff)
+            heapq.heappush(self.transfers, (end, req.id, req))
+            if self.verbose:
+                print(f"DisaggregatedServing: sending kv cache of the request #{req.id} ({link_size} bytes), arrives at {end}")
+
+    # the kv cache arrived at the decode pool
+    def finish_transfer(self):
+        end, _, req = heapq.heappop(self.transfers)
+        self.now = end
+        self.prefill.memory.free(req)
+        self.decode.add_arrived(req)
+        # freed prefill memory or a new decode request can make a batch
+        self.prefill_engine.waked = False
+        self.decode_engine.waked = False
+
+    def get_done(self):
+        return sorted(self.prefill.done + self.decode.done, key=lambda x : x.id)
+
+    # all kv cache of both pools is freed
+    def is_memory_freed(self):
+        for scheduler in [self.prefill, self.decode]:
+            memory = scheduler.memory
+            memory.evict_prefix_cache(memory.get_prefix_cache_size())
+            if memory.weight != memory.used_mem:
+                return False
+        return True
+
+    def print_result(self):
+        FREQ = 1000000000 # 1 GHz
+        done = self.get_done()
+        for req in done:
+            print(req)
+        total_latency = self.now / FREQ
+        print('---------------------------')
+        print('Throughput Results')
+        print('---------------------------')
+        print(f"Total prompts: {self.total_prompt} tokens")
+        print(f"Total generation: {self.total_gen} tokens")
+        print(f"Total clocks: {self.now} ticks")
+        print(f"Total latency: {total_latency:.3f} s")
+        if total_latency > 0:
+            print(f"Average prompt throughput: {self.total_prompt/total_latency:.3f} token/s")
+            print(f"Average generation throughput: {self.total_gen/total_latency:.3f} token/s")
+            print(f"Requests per second: {len(done)/total_latency:.3f} request/s")
+            if self.prefill.slo_requests > 0:
+                good = self.prefill.good + self.decode.good
+                print(f"Goodput: {good/total_latency:.3f} request/s ({good} of {len(done)} requests meet the SLO, {len(self.prefill.rejected)} rejected)")
+        print('---------------------------')
+        print('Disaggregated Serving Results')
+        print('---------------------------')
+        ttft = np.array([req.ttft for req in done], dtype=np.float64) / 1e6
+        tpot = np.array([req.tpot for req in self.decode.done], dtype=np.float64) / 1e6
+        print(f"Prefill pool ({self.prefill.npu_num} NPUs): {len(done)} requests, TTFT mean {ttft.mean():.3f} ms, p99 {np.percentile(ttft, 99):.3f} ms")
+        if len(tpot) != 0:
+            print(f"Decode pool ({self.decode.npu_num} NPUs): {len(tpot)} requests, TPOT mean {tpot.mean():.3f} ms, p99 {np.percentile(tpot, 99):.3f} ms")
+        if len(self.transfer_times) != 0:
+            print(f"KV transfer: {len(self.transfer_times)} requests, {self.transferred//1024//1024} MB per link, mean {np.mean(self.transfer_times)/1e6:.3f} ms including wait for decode memory")
+        for name, scheduler in [('Prefill', self.prefill), ('Decode', self.decode)]:
+            utilization, peak, fragmentation = scheduler.memory.get_block_stats()
+            print(f"{name} KV blocks: {utilization*100:.2f}% mean / {peak*100:.2f}% peak utilization, {fragmentation*100:.2f}% internal fragmentation")
+        print('---------------------------')
+
+    def save_output(self, output_file):
+        self.prefill.save_output(output_file, self.get_done())
@@ -0,0 +1,56 @@
+from abc import ABC, abstractmethod
+
+# victim policies of preemption when memory runs out
+# a policy picks the decode request to preempt among the running ones of the batch
+class EvictionPolicy(ABC):
+    name = None
+
+    # victims: decode requests of the batch whose kv cache is in memory, need: bytes missing to batch the first request
+    @abstractmethod
+    def select(self, victims, memory, need):
+        pass
+
+# the last decode request in queue order
+class Last(EvictionPolicy):
+    name = 'last'
+
+    def select(self, victims, memory, need):
+        return victims[-1]
+
+# least recently run
+class LRU(EvictionPolicy):
+    name = 'lru'
+
+    def select(self, victims, memory, need):
+        return min(victims, key=lambda req : req.last_run)
+
+# largest kv cache first
+class Largest(EvictionPolicy):
+    name = 'largest'
+
+    def select(self, victims, memory, need):
+        return max(victims, key=lambda req : memory.get_evict_kv(req))
+
+# most remaining output first, requests about to finish are evicted last
+class FewestRemaining(EvictionPolicy):
+    name = 'fewest_remaining'
+
+    def select(self, victims, memory, need):
+        return max(victims, key=lambda req : req.output - req.input)
+
+# fewest bytes over remote_bw: the smallest kv cache that frees enough memory, the largest one if none does
+class Cost(EvictionPolicy):
+    name = 'cost'
+
+    def select(self, victims, memory, need):
+        enough = [req for req in victims if memory.get_evict_kv(req) >= need]
+        if len(enough) != 0:
+            return min(enough, key=lambda req : memory.get_evict_kv(req))
+        return max(victims, key=lambda req : memory.get_evict_kv(req))
+
+
+EVICTION_POLICIES = {policy.name: policy for policy in [Last, LRU, Largest, FewestRemaining, Cost]}
+
+# name is one of EVICTION_POLICIES, checked by the choices of --eviction
+def get_eviction_policy(name):
+    return EVICTION_POLICIES[name]()
@@ -1,28 +1,65 @@
 import os
+import sys
+import argparse
+import importlib
 import subprocess
+import threading
 from time import time
 from .request import *
 
+CONVERTER_MODULE = 'chakra.src.converter.converter'
+
+# chakra converter module, imported once and run in this process
+_converter = None
+# the workload pipeline converts traces from its worker thread too
+_converter_lock = threading.Lock()
+
 def generate_graph(batch, hardware, total_num, event=False):
 
     cwd = os.getcwd()
-    chakra = os.path.join(cwd, "extern/graph_frontend/chakra")
-    os.chdir(chakra)
 
     if event:
         file_name = 'event_handler'
     else:
         file_name = f'{hardware}_{batch.model}_batch{batch.batch_id}'
 
-    workload_dir = f'../../../inputs/workload/{file_name}'
-    os.makedirs(workload_dir, exist_ok=True)
+    trace = os.path.join(cwd, f'inputs/trace/{file_name}.txt')
+    workload = os.path.join(cwd, f'inputs/workload/{file_name}/llm')
+    convert_trace(trace, workload, total_num)
+    return
+
+# convert the trace into chakra execution graphs {workload}.{npu_id}.et
+def convert_trace(trace, workload, total_num):
+    os.makedirs(os.path.dirname(workload), exist_ok=True)
+
+    converter = get_converter()
+    if converter == None:
+        # chakra is not importable, fall back to the command line converter
+        chakra = os.path.join(os.getcwd(), "extern/graph_frontend/chakra")
+        args = ['LLM', '--input', trace, '--output', workload, '--num-npus', str(total_num)]
+        subprocess.run([sys.executable, '-m', CONVERTER_MODULE] + args, cwd=chakra, text=True)
+        return
 
-    cmd = f'python -m chakra.src.converter.converter LLM ' \
-            f'--input ../../../inputs/trace/{file_name}.txt ' \
-            f'--output ../../../inputs/workload/{file_name}/llm ' \
-            f'--num-npus {total_num}'
+    # same arguments as the LLM subcommand of the command line converter
+    args = argparse.Namespace(input=trace, output=workload, num_npus=total_num, num_passes=1)
+    converter.convert_llm(args)
+    return
 
-    cmd = cmd.split()
-    subprocess.run(cmd, text=True)
-    os.chdir(cwd)
-    return
\ No newline at end of file
+# import the chakra converter once, None if it is not available
+def get_converter():
+    global _converter
+    with _converter_lock:
+        if _converter == None:
+            chakra = os.path.join(os.getcwd(), "extern/graph_frontend/chakra")
+            if chakra not in sys.path:
+                sys.path.insert(0, chakra)
+            try:
+                _converter = importlib.import_module(CONVERTER_MODULE)
+            except ImportError:
+                _converter = False
+            # older converters only have the command line entry point
+            if _converter and not hasattr(_converter, 'convert_llm'):
+                _converter = False
+        if _converter == False:
+            return None
+        return _converter
@@ -1,12 +1,10 @@
 import os
-import subprocess
-import re
 from .request import *
 from .utils import *
-import pandas as pd
-from .memory_model import calculate_sizes
+from .memory_model import calculate_sizes, calculate_chunk_sizes, KV_DTYPES
+from .perf_model import get_perf_model
 
-def generate_trace(batch, hardware, npu_num, npu_group, fp=16):
+def generate_trace(batch, hardware, npu_num, npu_group, fp=16, interp='linear'):
 
     model = batch.model
     tp = True
@@ -21,197 +19,195 @@ def generate_trace(batch, hardware, npu_num, npu_group, fp=16):
     evict_size = batch.evict
 
     input_len = batch.input
-    parallel = 'hybrid' # default
-    attn = []
-    init = []
-    for req in batch.requests:
-        attn.append(req.input)
-        init.append(req.is_init)
+    attn, init, prefilled = get_batch_attn(batch)
     # orca = " ".join(attn)
 
     print(f"Trace: batch #{batch.batch_id}: model: {model}, num requests: {len(attn)}, total length: {input_len}, prompt/kv_cache length: {sum(attn)}")
 
-    output_path = f"inputs/trace/{hardware}_{batch.model}_batch{batch.batch_id}.txt"
+    output_path = get_trace_path(batch, hardware)
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-    # make trace
-    synthsize_trace(hardware, model, input_len, attn, init, output_path, tp, fp)
-
-
-    with open(output_path, 'r') as f:
-        dic = []
-        for line in f.readlines():
-            split = re.findall(r'\S+', line)
-            dic.append(split)
-
-    # vllm: open output txt file and add load, evict mem 
-    mem = []
+    # vllm: add load or eviction in front of the trace
+    result = []
     if load_size != 0:
-        load = ["vllm_load_kv", '0', 'LOCAL', '0', 'REMOTE', str(load_size), 'REMOTE', '0', 'NONE', '0', 'NONE']
-        mem.append(load)
+        result.append(("vllm_load_kv", 0, 'LOCAL', 0, 'REMOTE', load_size, 'REMOTE', 0, 'NONE', 0))
     if evict_size != 0:
-        evict = ["vllm_evict_kv", '0', 'LOCAL', '0', 'REMOTE', str(evict_size), 'REMOTE', '0', 'NONE', '0', 'NONE']
-        mem.append(evict)
+        result.append(("vllm_evict_kv", 0, 'LOCAL', 0, 'REMOTE', evict_size, 'REMOTE', 0, 'NONE', 0))
+    # tiered kv store: wait for kv caches read from the SSD, modeled as a delay
+    if batch.kv_delay != 0:
+        result.append(("vllm_ssd_kv", batch.kv_delay, 'LOCAL', 0, 'LOCAL', 0, 'LOCAL', 0, 'NONE', 0))
+
+    # speculative decoding: steps of the draft model before the model verifies
+    for total_len, draft_attn, draft_init, draft_prefilled in get_draft_steps(batch):
+        result += synthsize_trace(hardware, batch.draft_model, total_len, draft_attn, draft_init, tp, interp, draft_prefilled, batch.kv_dtype)
 
-    result = mem + dic
+    # make trace
+    result += synthsize_trace(hardware, model, input_len, attn, init, tp, interp, prefilled, batch.kv_dtype)
+
+    lines = [f"ORCA\t\tmodel_parallel_NPU_group: {npu_group}\n", str(len(result))+'\n', header()]
+    # add layer_number at the end of the layer_name
+    # the other fields of a row are formatted once, block rows are shared by every decoder layer
+    fields = {}
+    for i, row in enumerate(result):
+        if isinstance(row, str):
+            lines.append(format_row(row))
+            continue
+        if id(row) not in fields:
+            fields[id(row)] = format_fields(*row[1:])
+        lines.append(f'{row[0]}_{i}'.ljust(NAME_WIDTH) + fields[id(row)])
 
     with open(output_path, 'w') as f:
-        f.write(f"ORCA\t\tmodel_parallel_NPU_group: {npu_group}\n")
-        f.write(str(len(result))+'\n')
-        f.write(header())
+        f.write(''.join(lines))
+    return
 
-        # add layer_number at the end of the layer_name
-        for i in range(0, len(result)):
-            if "ATTENTION" not in result[i][0]:
-                # name = '_'.join(result[i][0].split('_')[:-1])
-                new_string = f'{result[i][0]}_{i}'
-                f.write(formatter(new_string, *result[i][1:], parallel))
+# attn, init and prefilled of the requests of the batch for get_trace_layers
+# with speculative decoding, a decode request is verified like a chunk of spec_k + 1 tokens on top of its kv cache
+def get_batch_attn(batch):
+    attn = []
+    init = []
+    prefilled = []
+    for req in batch.requests:
+        if req.is_init:
+            attn.append(req.get_chunk())
+            init.append(True)
+            prefilled.append(req.prefilled)
+        elif batch.spec_k > 0:
+            attn.append(batch.spec_k + 1)
+            init.append(True)
+            prefilled.append(req.input)
+        else:
+            attn.append(req.input)
+            init.append(False)
+            prefilled.append(0)
+    return attn, init, prefilled
+
+# iterations of the draft model in a speculative decoding batch as (total_len, attn, init, prefilled)
+# the first step also prefills the prompts, then decode requests take spec_k - 1 more steps
+def get_draft_steps(batch):
+    if batch.spec_k == 0:
+        return []
+    prompts = [req for req in batch.requests if req.is_init]
+    decodes = [req for req in batch.requests if not req.is_init]
+    steps = []
+    attn = [req.get_chunk() for req in prompts] + [req.input for req in decodes]
+    init = [True] * len(prompts) + [False] * len(decodes)
+    prefilled = [req.prefilled for req in prompts] + [0] * len(decodes)
+    steps.append((sum(attn[:len(prompts)]) + len(decodes), attn, init, prefilled))
+    if len(decodes) != 0:
+        for j in range(1, batch.spec_k):
+            steps.append((len(decodes), [req.input + j for req in decodes], [False] * len(decodes), [0] * len(decodes)))
+    return steps
+
+# layers of the batch as (layer_name, latency, input_size, weight_size, output_size, comm_type, comm_size)
+# ATTENTION markers are kept as strings. head and tail are used once, block is repeated for every decoder layer
+# with chunked prefill, attn of a prefilling request is its chunk and prefilled the prompt tokens already in the kv cache
+# kv_dtype: precision of the kv cache read by the attention layers, None: same as the model
+def get_trace_layers(hardware, model, total_len, attn, init, tp, interp='linear', prefilled=None, kv_dtype=None):
+    perf = get_perf_model(hardware)
+    llama = 'llama' in model.lower()
+    if prefilled == None:
+        prefilled = [0] * len(attn)
+    kv_fp = KV_DTYPES[kv_dtype] / 8 if kv_dtype != None else None
+
+    # (layer_name, perf input, perf kv_cache, size length, init, comm) of each layer
+    # chunks of a prefill add the prefilled length: latency is perf(prefilled + chunk) - perf(prefilled)
+    head = [("embedding", total_len, 0, total_len, False, False)]
+    block = [
+        ("input_layernorm", total_len, 0, total_len, False, False),
+        # q, k ,v
+        ("q_proj", total_len, 0, total_len, False, False),
+        ("k_proj", total_len, 0, total_len, False, False),
+        ("v_proj", total_len, 0, total_len, False, False),
+    ]
+
+    # attention layer (Q*K=S & S*V), RoPE & Attention for llama
+    attn_names = ["rope", "attn"] if llama else ["qk_matmul", "softmax", "sv_matmul"]
+    for i in range(len(attn)):
+        block.append(f"ATTENTION {i}")
+        for name in attn_names:
+            if init[i] and prefilled[i] != 0:
+                block.append((name, prefilled[i] + attn[i], 0, attn[i], True, False, prefilled[i]))
+            elif init[i]:
+                block.append((name, attn[i], 0, attn[i], True, False))
             else:
-                f.write(formatter(' '.join(result[i]),'','','','','','','','','','', parallel))
-    return
+                block.append((name, 1, attn[i], attn[i], False, False))
+    block.append("ATTENTION END")
+
+    # attention projection, tensor parallelism synchronization (ALLREDUCE)
+    block.append(("o_proj", total_len, 0, total_len, False, True))
+    # layer norm2
+    block.append(("post_layernorm", total_len, 0, total_len, False, False))
+    if llama:
+        ffn_names = ["gate_proj", "up_proj", "act_fn"]
+        proj_name = "down_proj"
+    else:
+        ffn_names = ["fc1", "act_fn"]
+        proj_name = "fc2"
+    for name in ffn_names:
+        block.append((name, total_len, 0, total_len, False, False))
+    # tensor parallelism synchronization (ALLREDUCE)
+    block.append((proj_name, total_len, 0, total_len, False, True))
+
+    # final layer norm & lm_head
+    tail = [
+        ("final_layernorm", total_len, 0, total_len, False, False),
+        ("lm_head", total_len, 0, total_len, False, False),
+    ]
+
+    # look up latencies of the whole batch at once
+    layers = [layer for layer in head + block + tail if not isinstance(layer, str)]
+    keys = [(layer[0], layer[1], layer[2]) for layer in layers]
+    keys += [(layer[0], layer[6], 0) for layer in layers if len(layer) > 6]
+    found = perf.lookup_batch(model, keys, interp)
+    latencies = iter(found)
+    prefilled_latencies = iter(found[len(layers):])
 
-# makes trace for the batch
+    result = []
+    for part in [head, block, tail]:
+        rows = []
+        for layer in part:
+            if isinstance(layer, str):
+                rows.append(layer)
+                continue
+            layer_name, _, _, length, is_init, comm = layer[:6]
+            latency = next(latencies)
+            if len(layer) > 6:
+                latency = max(latency - next(prefilled_latencies), 0)
+                input_size, weight_size, output_size = calculate_chunk_sizes(model, layer_name, length, layer[6], kv_fp=kv_fp)
+            else:
+                input_size, weight_size, output_size = calculate_sizes(model, layer_name, length, is_init, kv_fp=kv_fp)
+            comm_type = 'NONE'
+            comm_size = 0
+            if comm and tp:
+                comm_type = 'ALLREDUCE'
+                comm_size = output_size
+            rows.append((layer_name, latency, input_size, weight_size, output_size, comm_type, comm_size))
+        result.append(rows)
+    return result
+
+# makes trace for the batch as rows of (layer_name, comp_time, input_loc, input_size, weight_loc, weight_size, output_loc, output_size, comm_type, comm_size)
+# ATTENTION markers are strings, rows of the block are the same objects for every decoder layer
 # change it as needed
-def synthsize_trace(hardware, model, total_len, attn, init, output_path, tp, fp=2):
-    file_path = f"../perf_model/{hardware}.csv"
-    df = pd.read_csv(file_path, sep=',')
+def synthsize_trace(hardware, model, total_len, attn, init, tp, interp='linear', prefilled=None, kv_dtype=None):
     config = get_config(model)
+    head, block, tail = get_trace_layers(hardware, model, total_len, attn, init, tp, interp, prefilled, kv_dtype)
 
-    with open(output_path, 'w') as f:
-        # f.write(header())
-        # write embedding
-        embedding_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == total_len) & (df['kv_cache'] == 0) & (df['layer_name'] == "embedding")]
-        emb_input, emb_weight, emb_output = calculate_sizes(model, embedding_matching_row["layer_name"].values[0], total_len)
-        f.write(formatter(str(embedding_matching_row["layer_name"].values[0]), str(embedding_matching_row['latency(ns)'].values[0]), 'REMOTE',
-             str(emb_input), 'LOCAL', str(emb_weight), 'REMOTE', str(emb_output), 'NONE', '0', 'NONE', 'hybrid'))
-
-        # make transformer block
-        block_res = []
-        input_ln_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == total_len) & (df['kv_cache'] == 0) & (df['layer_name'] == "input_layernorm")]
-        in_ln_input, in_ln_weight, in_ln_output = calculate_sizes(model, input_ln_matching_row["layer_name"].values[0], total_len)
-        block_res.append(formatter(str(input_ln_matching_row["layer_name"].values[0]), str(input_ln_matching_row['latency(ns)'].values[0]), 'REMOTE', str(in_ln_input), 'LOCAL', str(in_ln_weight), 'REMOTE', str(in_ln_output), 'NONE', '0', 'NONE', 'hybrid'))
-
-        # q, k ,v 
-        q_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == total_len) & (df['kv_cache'] == 0) & (df['layer_name'] == "q_proj")]
-        q_input, q_weight, q_output = calculate_sizes(model, q_matching_row["layer_name"].values[0], total_len)
-        block_res.append(formatter(str(q_matching_row["layer_name"].values[0]), str(q_matching_row['latency(ns)'].values[0]), 'REMOTE', str(q_input), 'LOCAL', str(q_weight), 'REMOTE',  str(q_output), 'NONE', '0', 'NONE', 'hybrid'))
-        k_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == total_len) & (df['kv_cache'] == 0) & (df['layer_name'] == "k_proj")]
-        k_input, k_weight, k_output = calculate_sizes(model, k_matching_row["layer_name"].values[0], total_len)
-        block_res.append(formatter(str(k_matching_row["layer_name"].values[0]), str(k_matching_row['latency(ns)'].values[0]), 'REMOTE', str(k_input), 'LOCAL', str(k_weight), 'REMOTE',  str(k_output), 'NONE', '0', 'NONE', 'hybrid'))
-        v_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == total_len) & (df['kv_cache'] == 0) & (df['layer_name'] == "v_proj")]
-        v_input, v_weight, v_output = calculate_sizes(model, v_matching_row["layer_name"].values[0], total_len)
-        block_res.append(formatter(str(v_matching_row["layer_name"].values[0]), str(v_matching_row['latency(ns)'].values[0]), 'REMOTE', str(v_input), 'LOCAL', str(v_weight), 'REMOTE',  str(v_output), 'NONE', '0', 'NONE', 'hybrid'))
-
-        
-        # attention layer (Q*K=S & S*V)
-        for i in range(len(attn)):
-            block_res.append(f"ATTENTION {i}\n")
-
-            if 'llama' in model.lower():
-                # RoPE
-                if init[i]:
-                    rope_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == attn[i]) & (df['kv_cache'] == 0) & (df['layer_name'] == "rope")]
-                else:
-                    rope_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == 1) & (df['kv_cache'] == attn[i]) & (df['layer_name'] == "rope")]
-                rope_input, rope_weight, rope_output = calculate_sizes(model, rope_matching_row["layer_name"].values[0], attn[i], init[i])
-                block_res.append(formatter(str(rope_matching_row["layer_name"].values[0]), str(rope_matching_row['latency(ns)'].values[0]), 'REMOTE', str(rope_input), 'LOCAL', str(rope_weight), 'REMOTE',  str(rope_output), 'NONE', '0', 'NONE', 'hybrid'))
-                # Attention
-                if init[i]:
-                    attn_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == attn[i]) & (df['kv_cache'] == 0) & (df['layer_name'] == "attn")]
-                else:
-                    attn_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == 1) & (df['kv_cache'] == attn[i]) & (df['layer_name'] == "attn")]
-                attn_input, attn_weight, attn_output = calculate_sizes(model, attn_matching_row["layer_name"].values[0], attn[i], init[i])
-                block_res.append(formatter(str(attn_matching_row["layer_name"].values[0]), str(attn_matching_row['latency(ns)'].values[0]), 'REMOTE', str(attn_input), 'LOCAL', str(attn_weight), 'REMOTE',  str(attn_output), 'NONE', '0', 'NONE', 'hybrid'))
+    def to_rows(layers):
+        rows = []
+        for layer in layers:
+            if isinstance(layer, str):
+                rows.append(layer)
             else:
-                # QK matmul
-                if init[i]:
-                    qk_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == attn[i]) & (df['kv_cache'] == 0) & (df['layer_name'] == "qk_matmul")]
-                else:
-                    qk_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == 1) & (df['kv_cache'] == attn[i]) & (df['layer_name'] == "qk_matmul")]
-                qk_input, qk_weight, qk_output = calculate_sizes(model, qk_matching_row["layer_name"].values[0], attn[i], init[i])
-                block_res.append(formatter(str(qk_matching_row["layer_name"].values[0]), str(qk_matching_row['latency(ns)'].values[0]), 'REMOTE', str(qk_input), 'LOCAL', str(qk_weight), 'REMOTE',  str(qk_output), 'NONE', '0', 'NONE', 'hybrid'))
-                # softmax
-                if init[i]:
-                    softmax_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == attn[i]) & (df['kv_cache'] == 0) & (df['layer_name'] == "softmax")]
-                else:
-                    softmax_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == 1) & (df['kv_cache'] == attn[i]) & (df['layer_name'] == "softmax")]
-                softmax_input, softmax_weight, softmax_output = calculate_sizes(model, softmax_matching_row["layer_name"].values[0], attn[i], init[i])
-                block_res.append(formatter(str(softmax_matching_row["layer_name"].values[0]), str(softmax_matching_row['latency(ns)'].values[0]), 'REMOTE', str(softmax_input), 'LOCAL', str(softmax_weight), 'REMOTE',  str(softmax_output), 'NONE', '0', 'NONE', 'hybrid'))
-                # SV matmul
-                if init[i]:
-                    sv_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == attn[i]) & (df['kv_cache'] == 0) & (df['layer_name'] == "sv_matmul")]
-                else:
-                    sv_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == 1) & (df['kv_cache'] == attn[i]) & (df['layer_name'] == "sv_matmul")]
-                sv_input, sv_weight, sv_output = calculate_sizes(model, sv_matching_row["layer_name"].values[0], attn[i], init[i])
-                block_res.append(formatter(str(sv_matching_row["layer_name"].values[0]), str(sv_matching_row['latency(ns)'].values[0]), 'REMOTE', str(sv_input), 'LOCAL', str(sv_weight), 'REMOTE',  str(sv_output), 'NONE', '0', 'NONE', 'hybrid'))
-            
-        block_res.append("ATTENTION END\n")
-
-        # attention projection
-        attn_dns_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == total_len) & (df['kv_cache'] == 0) & (df['layer_name'] == "o_proj")]
-        attn_input, attn_weight, attn_output = calculate_sizes(model, attn_dns_matching_row["layer_name"].values[0], total_len)
-        # tensor parallelism synchronization (ALLREDUCE)
-        attn_comm_size = 0
-        attn_comm_type = 'NONE' 
-        if tp:
-            attn_comm_size = attn_output
-            attn_comm_type = 'ALLREDUCE'
-        block_res.append(formatter(str(attn_dns_matching_row["layer_name"].values[0]), str(attn_dns_matching_row['latency(ns)'].values[0]), 'REMOTE', str(attn_input), 'LOCAL', str(attn_weight), 'REMOTE', str(attn_output), attn_comm_type, str(attn_comm_size), 'NONE', 'hybrid'))
-
-        # layer norm2
-        layer_norm2_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == total_len) & (df['kv_cache'] == 0) & (df['layer_name'] == "post_layernorm")]
-        layer_norm2_input, layer_norm2_weight, layer_norm2_output = calculate_sizes(model, layer_norm2_matching_row["layer_name"].values[0], total_len)
-        block_res.append(formatter(str(layer_norm2_matching_row["layer_name"].values[0]), str(layer_norm2_matching_row['latency(ns)'].values[0]), 'REMOTE', str(layer_norm2_input), 'LOCAL', str(layer_norm2_weight), 'REMOTE', str(layer_norm2_output), 'NONE', '0', 'NONE', 'hybrid'))
-
-        if 'llama' in model.lower():
-            ffn1_name = "gate_proj"
-        else:
-            ffn1_name = "fc1"
-
-        ffn1_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == total_len) & (df['kv_cache'] == 0) & (df['layer_name'] == ffn1_name)]
-        ffn1_input, ffn1_weight, ffn1_output = calculate_sizes(model, ffn1_matching_row["layer_name"].values[0], total_len)
-        block_res.append(formatter(str(ffn1_matching_row["layer_name"].values[0]), str(ffn1_matching_row['latency(ns)'].values[0]), 'REMOTE', str(ffn1_input), 'LOCAL', str(ffn1_weight), 'REMOTE', str(ffn1_output), 'NONE', '0', 'NONE', 'hybrid'))
-        
-        if 'llama' in model.lower():
-            ffn2_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == total_len) & (df['kv_cache'] == 0) & (df['layer_name'] == "up_proj")]
-            ffn2_input, ffn2_weight, ffn2_output = calculate_sizes(model, ffn2_matching_row["layer_name"].values[0], total_len)
-            block_res.append(formatter(str(ffn2_matching_row["layer_name"].values[0]), str(ffn2_matching_row['latency(ns)'].values[0]), 'REMOTE', str(ffn2_input), 'LOCAL', str(ffn2_weight), 'REMOTE', str(ffn2_output), 'NONE', '0', 'NONE', 'hybrid'))
-
-        act_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == total_len) & (df['kv_cache'] == 0) & (df['layer_name'] == "act_fn")]
-        act_input, act_weight, act_output = calculate_sizes(model, act_matching_row["layer_name"].values[0], total_len)
-        block_res.append(formatter(str(act_matching_row["layer_name"].values[0]), str(act_matching_row['latency(ns)'].values[0]), 'REMOTE', str(act_input), 'LOCAL', str(act_weight), 'REMOTE', str(act_output), 'NONE', '0', 'NONE', 'hybrid'))
-
-        if 'llama' in model.lower():
-            proj_name = "down_proj"
-        else:
-            proj_name = "fc2"
-        proj_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == total_len) & (df['kv_cache'] == 0) & (df['layer_name'] == proj_name)]
-        proj_input, proj_weight, proj_output = calculate_sizes(model, proj_matching_row["layer_name"].values[0], total_len)
-        # tensor parallelism synchronization (ALLREDUCE)
-        proj_comm_size = 0
-        proj_comm_type = 'NONE' 
-        if tp:
-            proj_comm_size = proj_output
-            proj_comm_type = 'ALLREDUCE'
-        block_res.append(formatter(str(proj_matching_row["layer_name"].values[0]), str(proj_matching_row['latency(ns)'].values[0]), 'REMOTE', str(proj_input), 'LOCAL', str(proj_weight), 'REMOTE', str(proj_output), proj_comm_type, str(proj_comm_size), 'NONE', 'hybrid'))
-   
-        for i in range(config['num_hidden_layers']):
-            f.writelines(block_res)
-
-        # add final layer norm
-        final_ln_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == total_len) & (df['kv_cache'] == 0) & (df['layer_name'] == "final_layernorm")]
-        final_ln_input, final_ln_weight, final_ln_output = calculate_sizes(model, final_ln_matching_row["layer_name"].values[0], total_len)
-        f.write(formatter(str(final_ln_matching_row["layer_name"].values[0]), str(final_ln_matching_row['latency(ns)'].values[0]), 'REMOTE', str(final_ln_input), 'LOCAL', str(final_ln_weight), 'REMOTE', str(final_ln_output), 'NONE', '0', 'NONE', 'hybrid'))
-
-        # add lm_head layer
-        lm_matching_row = df[(df['model'] == model) & (df['hardware'] == hardware) & (df['input'] == total_len) & (df['kv_cache'] == 0) & (df['layer_name'] == "lm_head")]
-        lm_input, lm_weight, lm_output = calculate_sizes(model, lm_matching_row["layer_name"].values[0], total_len)  
-        f.write(formatter(str(lm_matching_row["layer_name"].values[0]), str(lm_matching_row['latency(ns)'].values[0]), 'REMOTE', str(lm_input), 'LOCAL', str(lm_weight), 'REMOTE', str(lm_output), 'NONE', '0', 'NONE', 'hybrid'))
-        f.flush()
+                layer_name, latency, input_size, weight_size, output_size, comm_type, comm_size = layer
+                rows.append((layer_name, latency, 'REMOTE', input_size, 'LOCAL', weight_size, 'REMOTE', output_size, comm_type, comm_size))
+        return rows
+
+    return to_rows(head) + to_rows(block) * config['num_hidden_layers'] + to_rows(tail)
 
 
 # generate event for first request arrival
-def generate_event(alarm):
+# also used to replay a fixed latency with another file_name
+def generate_event(alarm, file_name='event_handler'):
     
     # make inputs for text file
     result = []
@@ -230,7 +226,7 @@ def generate_event(alarm):
     result.append([layer_name, comp_time, input_loc, input_size, weight_loc, weight_size, output_loc, output_size, comm_type, comm_size, misc])
 
     # write to the text file
-    output_path = f"inputs/trace/event_handler.txt"
+    output_path = f"inputs/trace/{file_name}.txt"
     with open(output_path, 'w') as f:
         f.write(f"EVENT\n")
         f.write(f'{len(result)}'+'\n') # length of the text is 1
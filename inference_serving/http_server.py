@@ -75,7 +75,8 @@ class LLMServingHandler(BaseHTTPRequestHandler):
             self.request_api.add_request(
                 model=model,
                 input_length=int(input_length),
-                output_length=output_length
+                output_length=output_length,
+                **self._request_options(request_data)
             )
             
             # Generate OpenAI-compatible response
@@ -109,7 +110,8 @@ class LLMServingHandler(BaseHTTPRequestHandler):
             self.request_api.add_request(
                 model=model,
                 input_length=int(input_length),
-                output_length=output_length
+                output_length=output_length,
+                **self._request_options(request_data)
             )
             
             # Generate OpenAI-compatible response
@@ -139,6 +141,17 @@ class LLMServingHandler(BaseHTTPRequestHandler):
         }
         self._send_json_response(200, models_response)
     
+    def _request_options(self, request_data):
+        """Optional scheduling fields of a request body: priority, deadline, shared prefix and SLOs"""
+        return {
+            'priority': int(request_data.get('priority', 0)),
+            'deadline': int(request_data.get('deadline_ns', -1)),
+            'prefix_id': int(request_data.get('prefix_id', -1)),
+            'prefix_len': int(request_data.get('prefix_tokens', 0)),
+            'slo_ttft': int(request_data.get('slo_ttft_ns', -1)),
+            'slo_tpot': int(request_data.get('slo_tpot_ns', -1))
+        }
+
     def _messages_to_prompt(self, messages):
         """Convert OpenAI messages format to a simple prompt"""
         prompt_parts = []
@@ -245,7 +258,8 @@ class LLMServingHandler(BaseHTTPRequestHandler):
             self.request_api.add_request(
                 model=model,
                 input_length=int(input_length),
-                output_length=output_length
+                output_length=output_length,
+                **self._request_options(request_data)
             )
             
             # Return response
@@ -0,0 +1,149 @@
+from collections import OrderedDict
+from itertools import islice
+
+DEMOTION_POLICIES = ['lru', 'largest']
+PROMOTION_POLICIES = ['lazy', 'eager']
+
+# a tier of memory that keeps swapped out kv caches, sizes are per NPU
+class KVTier():
+    def __init__(self, name, capacity, bw):
+        self.name = name
+        self.capacity = capacity # bytes, 0: unlimited
+        self.bw = bw # GB/s are bytes per ns
+        self.used = 0
+        self.peak = 0
+        self.entries = OrderedDict() # request -> size, least recently stored first
+
+    def has_room(self, size):
+        return self.capacity == 0 or self.used + size <= self.capacity
+
+    def add(self, req, size):
+        self.entries[req] = size
+        self.used += size
+        self.peak = max(self.peak, self.used)
+
+    def remove(self, req):
+        size = self.entries.pop(req)
+        self.used -= size
+        return size
+
+# tiered store of swapped out kv caches: host DRAM over remote_bw, then NVMe SSD over ssd_bw
+# the device (HBM) is the MemoryModel, swaps move kv caches between it and the host over remote_bw (batch.load, batch.evict)
+# kv caches that do not fit in the host are demoted to the SSD, and read back through the host when loaded
+# the SSD is one channel: demotions, promotions, prefetches and reads are serialized on it
+# reads and prefetches that are not done when the request is loaded delay its iteration (batch.kv_delay)
+class TieredKVStore():
+    def __init__(self, host_mem, remote_bw, ssd_mem=0, ssd_bw=4, demotion='lru', promotion='lazy', prefetch=0, verbose=False):
+        self.host = KVTier('DRAM', host_mem, remote_bw)
+        self.ssd = KVTier('SSD', ssd_mem, ssd_bw) if ssd_mem > 0 else None
+        # demotion, lru: least recently stored kv caches go to the SSD first, largest: largest ones first
+        # promotion, lazy: kv caches stay in the SSD until they are loaded, eager: moved back to the host as soon as it has room
+        # prefetch: evicted requests at the front of the queue whose kv caches are moved from the SSD to the host in advance
+        self.demotion = demotion
+        self.promotion = promotion
+        self.prefetch = prefetch
+        self.verbose = verbose
+
+        self.location = {} # request -> tier of its kv cache
+        self.ready = {} # request -> time its kv cache arrives in the host
+        self.ssd_free = 0 # time the SSD channel is free
+        # statistics
+        self.demoted = 0 # bytes
+        self.promoted = 0
+        self.prefetched = 0
+        self.ssd_reads = 0
+        self.stall = 0 # ns iterations waited for the SSD
+
+    # keep the kv cache of an evicted request, returns False if neither the host nor the SSD has room for it
+    def store(self, req, size, now):
+        if self.make_room(size, now):
+            tier = self.host
+        elif self.ssd != None and self.ssd.has_room(size):
+            tier = self.ssd
+            self.transfer(size, now)
+        else:
+            return False
+        tier.add(req, size)
+        self.location[req] = tier
+        if self.verbose:
+            print(f"TieredKVStore: kv cache of the request #{req.id} stored in {tier.name}")
+        return True
+
+    # take the kv cache of a request back to the device, returns ns the iteration waits for it
+    def load(self, req, now):
+        tier = self.location.pop(req)
+        size = tier.remove(req)
+        if tier is self.ssd:
+            end = self.transfer(size, now)
+            self.ssd_reads += size
+        else:
+            end = self.ready.pop(req, now)
+        delay = max(end - now, 0)
+        self.stall += delay
+        if self.promotion == 'eager':
+            self.promote(now)
+        return delay
+
+    # demote kv caches in the host to the SSD until size bytes fit, returns False if they do not
+    def make_room(self, size, now):
+        while not self.host.has_room(size):
+            # kv caches in flight to the host are not demoted again
+            entries = [req for req in self.host.entries if self.ready.get(req, now) <= now]
+            if self.ssd == None or len(entries) == 0:
+                return False
+            if self.demotion == 'largest':
+                victim = max(entries, key=lambda req : self.host.entries[req])
+            else:
+                victim = entries[0]
+            victim_size = self.host.entries[victim]
+            if not self.ssd.has_room(victim_size):
+                return False
+            self.host.remove(victim)
+            self.ready.pop(victim, None)
+            self.ssd.add(victim, victim_size)
+            self.location[victim] = self.ssd
+            self.transfer(victim_size, now)
+            self.demoted += victim_size
+            if self.verbose:
+                print(f"TieredKVStore: kv cache of the request #{victim.id} demoted to SSD")
+        return True
+
+    # move kv caches from the SSD to the host while it has room, oldest first
+    def promote(self, now):
+        if self.ssd == None:
+            return
+        for req in list(self.ssd.entries):
+            if not self.move_to_host(req, now):
+                break
+            self.promoted += self.host.entries[req]
+
+    # kv caches can be prefetched: prefetch is on and the SSD holds some
+    def can_prefetch(self):
+        return self.ssd != None and self.prefetch != 0 and len(self.ssd.entries) != 0
+
+    # prefetch the kv caches of the next evicted requests, reqs is an iterable in scheduling order read up to prefetch requests
+    def prefetch_requests(self, reqs, now):
+        if not self.can_prefetch():
+            return
+        for req in islice(reqs, self.prefetch):
+            if self.location.get(req) is self.ssd and self.move_to_host(req, now):
+                self.prefetched += self.host.entries[req]
+                if self.verbose:
+                    print(f"TieredKVStore: prefetching kv cache of the request #{req.id}")
+
+    # start moving a kv cache from the SSD to the host if it has room
+    def move_to_host(self, req, now):
+        size = self.ssd.entries[req]
+        if not self.host.has_room(size):
+            return False
+        self.ssd.remove(req)
+        self.host.add(req, size)
+        self.location[req] = self.host
+        self.ready[req] = self.transfer(size, now)
+        return True
+
+    # serialize a transfer of size bytes on the SSD channel, returns the time it ends
+    def transfer(self, size, now):
+        start = max(now, self.ssd_free)
+        self.ssd_free = start + int(size / self.ssd.bw)
+        return self.ssd_free
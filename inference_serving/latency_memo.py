@@ -0,0 +1,67 @@
+import os
+from collections import OrderedDict
+from .generate_graph import convert_trace
+from .generate_trace import generate_event
+
+# latencies of iterations measured earlier in this run, keyed by the signature of the batch
+# a batch that hits runs a fixed latency event in AnalyticalAstra instead of the whole trace
+# kv_cache lengths of decode requests can be rounded up to a bucket so that near-identical batches share a latency
+class LatencyMemo():
+    def __init__(self, npu_num, max_size=4096, bucket=1, verbose=False):
+        self.npu_num = npu_num
+        self.max_size = max_size
+        self.bucket = bucket
+        self.verbose = verbose
+        self.table = OrderedDict() # signature -> latency, least recently used first
+        self.started = {} # batch_id -> (signature, start cycle) of measured batches
+        self.workloads = {} # latency -> event workload
+        self.hits = 0
+        self.misses = 0
+
+    # signature of the batch with the kv_cache length of each decode request rounded up to the bucket
+    def get_key(self, batch):
+        signature = batch.get_signature()
+        if self.bucket == 1:
+            return signature
+        bucket = self.bucket
+        reqs = tuple((input if is_init else -(-input // bucket) * bucket, is_init, *rest) for input, is_init, *rest in signature[-1])
+        return signature[:-1] + (reqs,)
+
+    def has(self, batch):
+        return self.get_key(batch) in self.table
+
+    # set the batch to replay its memoized latency, returns True on hit
+    def replay(self, batch, current):
+        signature = self.get_key(batch)
+        if signature not in self.table:
+            self.misses += 1
+            self.started[batch.batch_id] = (signature, current)
+            return False
+        self.hits += 1
+        self.table.move_to_end(signature)
+        latency = self.table[signature]
+        batch.workload = self.get_workload(latency)
+        if self.verbose:
+            print(f"LatencyMemo: batch #{batch.batch_id} replays {latency} ns")
+        return True
+
+    # the first NPU finished the iteration of the batch, memoize the measured latency
+    def finish(self, batch_id, current):
+        if batch_id not in self.started:
+            return
+        signature, start = self.started.pop(batch_id)
+        self.table[signature] = current - start
+        self.table.move_to_end(signature)
+        if len(self.table) > self.max_size:
+            self.table.popitem(last=False)
+
+    # workload of an event that takes latency ns, made once per latency
+    def get_workload(self, latency):
+        if latency not in self.workloads:
+            file_name = f'memo_{latency}ns'
+            generate_event(latency, file_name)
+            cwd = os.getcwd()
+            workload = os.path.join(cwd, f'inputs/workload/{file_name}/llm')
+            convert_trace(os.path.join(cwd, f'inputs/trace/{file_name}.txt'), workload, self.npu_num)
+            self.workloads[latency] = workload
+        return self.workloads[latency]
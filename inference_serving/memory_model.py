@@ -1,13 +1,22 @@
 import os
+import numpy as np
+from functools import lru_cache
 from .utils import get_config
+from .prefix_cache import PrefixCache
+from .block_allocator import BlockAllocator
+
+# precision of the kv cache in bits (--kv_dtype), the model precision (--fp) by default
+KV_DTYPES = {'fp16': 16, 'fp8': 8, 'int4': 4}
 
 class MemoryModel():
-    def __init__(self, model, npu_num, npu_mem, block_size, fp, verbose=False):
+    def __init__(self, model, npu_num, npu_mem, block_size, fp, verbose=False, prefix_caching=False, draft_model=None, spec_k=0, kv_dtype=None):
         self.model = model
         self.npu_num = npu_num
         self.npu_mem = npu_mem
         self.block_size = block_size
         self.fp = fp // 8 # bit -> byte of floating point
+        self.kv_dtype = kv_dtype
+        self.kv_fp = KV_DTYPES[kv_dtype] if kv_dtype != None else fp # bits of a kv cache element
         self.verbose = verbose
 
         self.config = get_config(model)
@@ -15,66 +24,93 @@ class MemoryModel():
         self.n_layer = self.config['num_hidden_layers']
         self.n_head = self.config['num_attention_heads']
         self.vocab_size = self.config['vocab_size']
+        # kv heads * head dim * layers of every model that keeps kv cache of a token, smaller than hidden size * layers with GQA
+        self.kv_dim = self.get_kv_dim(model)
 
         # assume NPUS use identical memory
         self.npu_mem = npu_mem * 1000000000
 
         # Memory model
         self.weight = self.get_weight() # assume weight is loaded
+        # speculative decoding: weight and kv cache of the draft model are kept with the model
+        # kv cache of spec_k draft tokens is reserved for each decode request in an iteration
+        self.draft_model = draft_model
+        self.spec_k = spec_k
+        self.draft_weight = 0
+        if draft_model != None:
+            self.draft_weight = self.get_weight(draft_model)
+            self.weight += self.draft_weight
+            self.kv_dim += self.get_kv_dim(draft_model)
         self.kv_npu = self.npu_num # npus that store KV cache
         self.used_mem = self.weight
 
+        # paged kv cache: memory left by the weight is a pool of blocks, used_mem always counts whole blocks
+        self.block_kv = self.get_kv(self.block_size)
+        self.allocator = BlockAllocator(max(self.npu_mem - self.weight, 0) // self.block_kv, block_size)
+        self.tokens = {} # request -> tokens in its blocks
+        # block statistics sampled every iteration
+        self.samples = 0
+        self.utilization = 0 # sum of used / total blocks
+        self.fragmentation = 0 # sum of empty / used token slots
+
+        # automatic prefix caching, blocks of shared prefixes are owned by the cache
+        self.prefix_cache = None
+        if prefix_caching:
+            self.prefix_cache = PrefixCache(block_size, verbose)
+
 
-    # get weight of the model 
-    def get_weight(self):
-        cwd = os.getcwd()
+    # get weight of the model, the served model by default
+    def get_weight(self, model=None):
+        if model == None:
+            model = self.model
+        n_layer = get_config(model)['num_hidden_layers']
         weight = 0
 
         # embedding
-        _, embedding, _ = calculate_sizes(self.model, 'embedding', 1)
+        _, embedding, _ = calculate_sizes(model, 'embedding', 1)
         weight += embedding
 
         # block
         block_weight = 0
         # input layernorm
-        _, input_ln, _ = calculate_sizes(self.model, 'input_layernorm', 1)
+        _, input_ln, _ = calculate_sizes(model, 'input_layernorm', 1)
         block_weight += input_ln
         # qkv
-        _, q, _ = calculate_sizes(self.model, 'q_proj', 1)
+        _, q, _ = calculate_sizes(model, 'q_proj', 1)
         block_weight += q
-        _, k, _ = calculate_sizes(self.model, 'k_proj', 1)
+        _, k, _ = calculate_sizes(model, 'k_proj', 1)
         block_weight += k
-        _, v, _ = calculate_sizes(self.model, 'v_proj', 1)
+        _, v, _ = calculate_sizes(model, 'v_proj', 1)
         block_weight += v
         # attention dense
-        _, attn_dns, _ = calculate_sizes(self.model, 'o_proj', 1)
+        _, attn_dns, _ = calculate_sizes(model, 'o_proj', 1)
         block_weight += attn_dns
-        if 'llama' in self.model.lower():
-            _, ffn1, _ = calculate_sizes(self.model, 'gate_proj', 1)
+        if 'llama' in model.lower():
+            _, ffn1, _ = calculate_sizes(model, 'gate_proj', 1)
             block_weight += ffn1
-            _, ffn2, _ = calculate_sizes(self.model, 'up_proj', 1)
+            _, ffn2, _ = calculate_sizes(model, 'up_proj', 1)
             block_weight += ffn2
-            _, ffn3, _ = calculate_sizes(self.model, 'down_proj', 1)
+            _, ffn3, _ = calculate_sizes(model, 'down_proj', 1)
             block_weight += ffn3
         else:
         # mlp fc
-            _, ffn1, _ = calculate_sizes(self.model, 'fc1', 1)
+            _, ffn1, _ = calculate_sizes(model, 'fc1', 1)
             block_weight += ffn1
             # mlp proj
-            _, ffn2, _ = calculate_sizes(self.model, 'fc2', 1)
+            _, ffn2, _ = calculate_sizes(model, 'fc2', 1)
             block_weight += ffn2
    
         # post layernorm
-        _, post_ln, _ = calculate_sizes(self.model, 'post_layernorm', 1)
+        _, post_ln, _ = calculate_sizes(model, 'post_layernorm', 1)
         block_weight += post_ln
 
-        weight += block_weight * self.n_layer
+        weight += block_weight * n_layer
 
         # ln_f
-        _, ln_f, _ = calculate_sizes(self.model, 'final_layernorm', 1)
+        _, ln_f, _ = calculate_sizes(model, 'final_layernorm', 1)
         weight += ln_f
         # lm_head
-        _, lm_head, _ = calculate_sizes(self.model, 'lm_head', 1)
+        _, lm_head, _ = calculate_sizes(model, 'lm_head', 1)
         weight += lm_head
 
         if self.verbose:
@@ -83,13 +119,17 @@ class MemoryModel():
         return weight // self.npu_num
 
 
+    def get_kv_dim(self, model):
+        spec = get_model_spec(model)
+        return spec.kv_dim * spec.n_layer
+
     def get_kv(self, seq):
         # shape of kv cache
-        # (n_head, batch_size, n_embd//n_head, seq_len) per layer
+        # (kv_head, batch_size, head_dim, seq_len) per layer
         # return batch_size = 1 to caclulate max batch_size in scheduler
 
         # K & V multiply 2 
-        return 2 * self.n_embd * seq * self.n_layer * self.fp // self.kv_npu
+        return 2 * self.kv_dim * seq * self.kv_fp // 8 // self.kv_npu
     
     # used when batching. in case of vllm, it is only used in init phase
     def get_batch_kv(self, batch_req, batch_len):
@@ -105,25 +145,138 @@ class MemoryModel():
     def get_block_kv(self, batch_req, batch_len):
         block_kv_size = 0
         for i in range(batch_len):
-            if batch_req[i].evict or batch_req[i].is_init:
-                num_blocks = batch_req[i].input // self.block_size + 1 # it includes kv_cache that will be generated in current iteration
-                block_kv_size += self.get_kv(num_blocks * self.block_size)
-            else:
-                num_before = (batch_req[i].input - 1) // self.block_size + 1
-                num_after = batch_req[i].input // self.block_size + 1 # it includes kv_cache that will be generated in current iteration
-                if num_after > num_before: # difference of the block is maximum one block
-                    block_kv_size += self.get_kv(self.block_size)
+            block_kv_size += self.get_req_block_kv(batch_req[i])
         
         return block_kv_size
-    
+
+    # get_block_kv of the first i requests at index i, for every i in 0..len(batch_req)
+    def get_block_kv_prefix(self, batch_req):
+        prefix = [0]
+        for req in batch_req:
+            prefix.append(prefix[-1] + self.get_req_block_kv(req))
+        return prefix
+
+    # size of kv block that should be added for a request
+    def get_req_block_kv(self, req):
+        return self.get_req_blocks(req) * self.block_kv
+
+    # number of kv blocks that should be added for a request
+    def get_req_blocks(self, req):
+        if req.is_init and req.get_chunk() != req.input:
+            # chunked prefill: kv cache of the chunk
+            prefilled = req.prefilled + req.get_chunk()
+            num_before = -(-req.prefilled // self.block_size)
+            if prefilled < req.input:
+                num_after = -(-prefilled // self.block_size)
+            else:
+                num_after = req.input // self.block_size + 1 # it includes kv_cache that will be generated in current iteration
+            return num_after - num_before
+        if req.evict or req.is_init:
+            num_blocks = req.input // self.block_size + 1 # it includes kv_cache that will be generated in current iteration
+            if not req.is_init:
+                num_blocks = (req.input + self.spec_k) // self.block_size + 1
+            return num_blocks - req.prefix_blocks
+        num_before = (req.input - 1) // self.block_size + 1
+        num_after = (req.input + self.spec_k) // self.block_size + 1 # it includes kv_cache that will be generated in current iteration
+        if num_after > num_before: # difference of the block is maximum one block without speculative decoding
+            return num_after - num_before
+        return 0
+
+    # kv blocks reserved for draft tokens that were not accepted, when the decode request advances by advance tokens
+    def get_unused_blocks(self, req, advance):
+        num_reserved = (req.input + self.spec_k) // self.block_size + 1
+        num_used = (req.input + advance - 1) // self.block_size + 1
+        return num_reserved - num_used
+
     # get size of kv cache that should be evicted
     def get_evict_kv(self, req):
-        evict_size = 0
-        # input + 1 is not loaded now
-        num_blocks = (req.input-1) // self.block_size + 1
-        evict_size += self.get_kv(num_blocks * self.block_size)
-        return evict_size
-    
+        return self.get_evict_blocks(req) * self.block_kv
+
+    # number of kv blocks owned by the request, input + 1 is not loaded now
+    # blocks of the prefix cache are shared, not owned by the request
+    def get_evict_blocks(self, req):
+        return (req.input - 1) // self.block_size + 1 - req.prefix_blocks
+
+    # memory of the prefix cache, including blocks without references
+    def get_prefix_cache_size(self):
+        if self.prefix_cache == None:
+            return 0
+        return len(self.prefix_cache.blocks) * self.block_kv
+
+    # evict unreferenced prefix blocks to free at least size bytes if possible, returns freed bytes
+    def evict_prefix_cache(self, size):
+        if self.prefix_cache == None or size <= 0:
+            return 0
+        evicted = self.prefix_cache.evict(-(-size // self.block_kv))
+        freed = self.allocator.release(self.prefix_cache, evicted) * self.block_kv
+        if freed > 0:
+            self.mem_store(freed)
+        return freed
+
+    # grow the block tables of the batched requests for their iteration, returns the allocated bytes
+    def allocate_batch(self, batch_req):
+        blocks = [self.get_req_blocks(req) for req in batch_req]
+        size = sum(blocks) * self.block_kv
+        if size > 0:
+            self.mem_load(size)
+        for req, num in zip(batch_req, blocks):
+            self.allocator.allocate(req, num)
+            # tokens once the iteration is done, the prefix blocks are not in the table
+            tokens = req.prefilled + req.get_chunk() if req.is_init else req.input
+            self.tokens[req] = tokens - req.prefix_blocks * self.block_size
+        self.sample_blocks()
+        return size
+
+    # allocate the whole kv cache of a request that is not batched (e.g. received from another pool)
+    def allocate(self, req):
+        num = self.get_evict_blocks(req)
+        self.mem_load(num * self.block_kv)
+        self.allocator.allocate(req, num)
+        self.tokens[req] = req.input - 1 - req.prefix_blocks * self.block_size
+
+    # free num last blocks of the request (all by default), returns the freed bytes
+    def free(self, req, num=None):
+        size = self.allocator.release(req, num) * self.block_kv
+        self.mem_store(size)
+        if len(self.allocator.get_table(req)) == 0:
+            self.tokens.pop(req, None)
+        return size
+
+    # leading blocks of the request went to the prefix cache: num of them are shared from now on, dup were cached by another request and freed
+    def share(self, req, num, dup):
+        self.allocator.move(req, self.prefix_cache, num)
+        if dup > 0:
+            self.allocator.release(req, dup, front=True)
+            self.mem_store(dup * self.block_kv)
+        if req in self.tokens:
+            self.tokens[req] -= (num + dup) * self.block_size
+        if len(self.allocator.get_table(req)) == 0:
+            self.tokens.pop(req, None)
+
+    # record utilization and internal fragmentation of the blocks
+    def sample_blocks(self):
+        allocator = self.allocator
+        used = allocator.get_num_used()
+        slots = used * self.block_size
+        empty = 0
+        for owner, table in allocator.tables.items():
+            if owner in self.tokens:
+                empty += len(table) * self.block_size - min(max(self.tokens[owner], 0), len(table) * self.block_size)
+        utilization = used / allocator.num_blocks if allocator.num_blocks > 0 else 0
+        fragmentation = empty / slots if slots > 0 else 0
+        self.samples += 1
+        self.utilization += utilization
+        self.fragmentation += fragmentation
+        if self.verbose:
+            print(f"Memory: blocks: {used}/{allocator.num_blocks} used ({utilization * 100:.2f}%), fragmentation: {fragmentation * 100:.2f}%")
+
+    # mean utilization, peak utilization and mean internal fragmentation of the blocks
+    def get_block_stats(self):
+        num_blocks = self.allocator.num_blocks
+        if self.samples == 0 or num_blocks == 0:
+            return 0, 0, 0
+        return self.utilization / self.samples, self.allocator.peak / num_blocks, self.fragmentation / self.samples
+
     def mem_load(self, size):
         if self.used_mem + size > self.npu_mem:
             print("ERROR: memLoad: no memory to load")
@@ -142,122 +295,138 @@ class MemoryModel():
         if self.verbose:
             print(f"after: {self.used_mem}")
 
+    # the weights have to leave at least one kv block on an NPU, checked once at startup
+    def has_kv_room(self):
+        if self.allocator.num_blocks > 0:
+            return True
+        weights = f"{self.model} ({(self.weight - self.draft_weight) / 1e9:.2f} GB)"
+        if self.draft_model != None:
+            weights += f" and draft model {self.draft_model} ({self.draft_weight / 1e9:.2f} GB)"
+        print(f"ERROR: no memory left for kv cache, weights of {weights} per NPU fill the {self.npu_mem / 1e9:.2f} GB npu_mem, a kv block needs {self.block_kv / 1e6:.2f} MB")
+        return False
+
     def mem_avail(self, size):
         if self.npu_mem - self.used_mem >= size:
             return True
         else:
             return False 
 
+# sizes of every layer of a model, read from the model config once per process
+# each size is a polynomial of the sequence length in elements: (length^2, length, constant)
+# sizes[(layer_name, init)] = (input, weight, output, kv), init only matters for the attention layers
+# kv is the part of the input read from the kv cache (kv_head heads with GQA), it is sized in the kv cache precision
+class ModelSpec():
+    def __init__(self, model):
+        config = get_config(model)
+        self.model = model
+        self.n_embd = config['hidden_size']
+        self.n_layer = config['num_hidden_layers']
+        self.n_head = config['num_attention_heads']
+        self.head_dim = config.get("head_dim", self.n_embd // self.n_head)
+        self.vocab_size = config['vocab_size']
+        self.kv_head = config.get("num_key_value_heads", self.n_head)  # fallback to n_head if not defined
+        self.kv_dim = self.kv_head * self.head_dim # n_embd // group size without head_dim in the config
+        self.ffn_dim = config.get("intermediate_size", config.get("ffn_dim")) # config conatins ffn_dim or intermediate_size
+        self.llama = "llama" in model.lower()
+        self.sizes = self.get_sizes()
+
+    def get_sizes(self):
+        E = self.n_embd
+        V = self.vocab_size
+        F = self.ffn_dim
+        nh = self.n_head
+        hd = self.head_dim
+        kv = self.kv_dim
+        none = (0, 0, 0)
+        sizes = {}
+
+        def add(layer_name, input, weight, output, init=None, kv_input=none):
+            for is_init in [False, True] if init == None else [init]:
+                sizes[(layer_name, is_init)] = (input, weight, output, kv_input)
+
+        add("embedding", (0, 1, 0), (0, 0, V * E), (0, E, 0))
+        for name in ["input_layernorm", "post_layernorm", "final_layernorm"]:
+            # llama use RMSNorm, only scale. others scale + bias
+            add(name, (0, E, 0), (0, 0, (1 if self.llama else 2) * E), (0, E, 0))
+        add("q_proj", (0, E, 0), (0, 0, E * E), (0, E, 0))
+        # kv_dim if GQA is used, output is n_embd to match V_Projection input
+        add("k_proj", (0, E, 0), (0, 0, E * self.kv_dim), (0, E, 0))
+        add("v_proj", (0, E, 0), (0, 0, E * self.kv_dim), (0, E, 0))
+        # only for llama, input/output q, k
+        add("rope", (0, (nh + self.kv_head) * hd, 0), none, (0, (nh + self.kv_head) * hd, 0))
+        # only for llama, q + k + v
+        add("attn", (0, nh * hd, 0), none, (0, nh * hd, 0), True, (0, kv * 2, 0))
+        add("attn", (0, 0, nh * hd), none, (0, 0, nh * hd), False, (0, kv * 2, 0))
+        # q + k
+        add("qk_matmul", (0, nh * hd, 0), none, (nh, 0, 0), True, (0, kv, 0))
+        add("qk_matmul", (0, 0, nh * hd), none, (0, nh, 0), False, (0, kv, 0))
+        add("softmax", (nh, 0, 0), none, (nh, 0, 0), True)
+        add("softmax", (0, nh, 0), none, (0, nh, 0), False)
+        # s (output of Softmax) + v
+        add("sv_matmul", (nh, 0, 0), none, (0, nh * hd, 0), True, (0, kv, 0))
+        add("sv_matmul", (0, nh, 0), none, (0, 0, nh * hd), False, (0, kv, 0))
+        add("o_proj", (0, E, 0), (0, 0, E * E), (0, E, 0))
+        if F != None:
+            add("gate_proj", (0, E, 0), (0, 0, E * F), (0, F, 0)) # only for llama
+            add("up_proj", (0, F, 0), (0, 0, E * F), (0, F, 0)) # only for llama, input to match gate_proj output
+            add("fc1", (0, E, 0), (0, 0, E * F), (0, F, 0))
+            add("act_fn", (0, F, 0), none, (0, F, 0))
+            add("down_proj", (0, F, 0), (0, 0, F * E), (0, E, 0)) # only for llama
+            add("fc2", (0, F, 0), (0, 0, F * E), (0, E, 0))
+        add("lm_head", (0, E, 0), (0, 0, E * V), (0, V, 0))
+        return sizes
+
+# get spec of the model, built once per process
+@lru_cache(maxsize=None)
+def get_model_spec(model):
+    return ModelSpec(model)
+
 # calculate the input, weight, output size of each layer
-def calculate_sizes(model, layer_name, length, init=False, fp=2):
-    config = get_config(model)
-    n_embd = config['hidden_size']
-    n_head = config['num_attention_heads']
-    head_dim = n_embd // n_head
-    vocab_size = config['vocab_size']
-    kv_head = config.get("num_key_value_heads", n_head)  # fallback to n_head if not defined
-    group = n_head // kv_head  # group size
-    kv_dim = n_embd // group   # equivalent to: kv_head * (n_embd // n_head)
-    ffn_dim = config.get("intermediate_size", config.get("ffn_dim")) # config conatins ffn_dim or intermediate_size
-    
-    if layer_name == "embedding":
-        input_size = length * fp
-        weight_size = vocab_size * n_embd * fp
-        output_size = length * n_embd * fp
-    elif layer_name in ["input_layernorm", "post_layernorm", "final_layernorm"]:
-        input_size = length * n_embd * fp
-        if "llama" in model.lower(): # llama use RMSNorm
-            weight_size = 1 * n_embd * fp  # only scale
-        else:
-            weight_size = 2 * n_embd * fp  # scale + bias
-        output_size = length * n_embd * fp
-    elif layer_name == "q_proj":
-        input_size = length * n_embd * fp
-        weight_size = n_embd * n_embd * fp
-        output_size = length * n_embd * fp
-    elif layer_name == "k_proj":
-        input_size = length * n_embd * fp
-        weight_size = n_embd * kv_dim * fp # kv_dim if GQA is used
-        output_size = length * n_embd * fp # orignal "length * kv_dim * fp" but to match V_Projection input
-    elif layer_name == "v_proj":
-        input_size = length * n_embd * fp
-        weight_size = n_embd * kv_dim * fp # kv_dim if GQA is used
-        output_size = length * n_embd * fp
-    elif layer_name == "rope": # only for llama
-        input_size =  (n_head + kv_head) * length * head_dim * fp # input q, k
-        weight_size = 0
-        output_size = (n_head + kv_head) * length * head_dim * fp # output q, k
-    elif layer_name == "attn": # only for llama
-        if init:
-            input_size = n_head * length * head_dim * fp * 3 # q (input) + k (input) + v (input)
-            weight_size = 0
-            output_size = n_head * length * head_dim * fp
-        else:
-            input_size = n_head * 1 * head_dim * fp + n_head * head_dim * length * fp * 2 # q (input) + k (input) + v (input)
-            weight_size = 0
-            output_size = n_head * 1 * head_dim * fp
+# kv_fp: bytes of a kv cache element (0.5 for int4), fp by default
+def calculate_sizes(model, layer_name, length, init=False, fp=2, kv_fp=None):
+    sizes = get_model_spec(model).sizes.get((layer_name, bool(init)))
+    if sizes == None:
+        print(f"ERROR: calculate_sizes: No matching layer name {layer_name} found for model {model}")
+        return 0, 0, 0
+    if kv_fp == None:
+        kv_fp = fp
+    input, weight, output, kv = (a * length * length + b * length + c for a, b, c in sizes)
+    return input * fp + int(kv * kv_fp), weight * fp, output * fp
+
+# calculate the input, weight, output size of an attention layer for a prefill chunk of length tokens
+# that attends to kv_cache tokens prefilled in earlier iterations
+def calculate_chunk_sizes(model, layer_name, length, kv_cache, fp=2, kv_fp=None):
+    spec = get_model_spec(model)
+    nh = spec.n_head
+    hd = spec.head_dim
+    kv = spec.kv_dim
+    total = length + kv_cache
+    if kv_fp == None:
+        kv_fp = fp
+    if layer_name == "attn": # only for llama
+        input_size = nh * length * hd * fp + int(kv * total * kv_fp * 2) # q (chunk) + k, v (cache + chunk)
+        output_size = nh * length * hd * fp
     elif layer_name == "qk_matmul":
-        if init:
-            input_size = n_head * length * head_dim * fp + n_head * head_dim * length * fp # q (input) + k (input)
-            weight_size = 0
-            output_size = n_head * length * length * fp
-        else:
-            input_size = n_head * 1 * head_dim * fp + n_head * head_dim * length * fp # q (input) + k (input)
-            weight_size = 0
-            output_size = n_head * 1 * length * fp
+        input_size = nh * length * hd * fp + int(kv * total * kv_fp) # q (chunk) + k (cache + chunk)
+        output_size = nh * length * total * fp
     elif layer_name == "softmax":
-        if init:
-            input_size = n_head * length * length * fp # output of QK_Matmul
-            weight_size = 0
-            output_size = n_head * length * length * fp
-        else:
-            input_size = n_head * 1 * length * fp
-            weight_size = 0
-            output_size = n_head * 1 * length * fp
+        input_size = nh * length * total * fp
+        output_size = nh * length * total * fp
     elif layer_name == "sv_matmul":
-        if init:
-            input_size = n_head * length * length * fp + n_head * length * head_dim * fp # s (output of Softmax) + v (input)
-            weight_size = 0
-            output_size = n_head * length * head_dim * fp
-        else:
-            input_size = n_head * 1 * length * fp + n_head * length * head_dim * fp
-            weight_size = 0
-            output_size = n_head * 1 * head_dim * fp
-    elif layer_name == "o_proj":
-        input_size = length * n_embd * fp
-        weight_size = n_embd * n_embd * fp
-        output_size = length * n_embd * fp
-    elif layer_name == "gate_proj": # only for llama
-        input_size = length * n_embd * fp
-        weight_size = n_embd * ffn_dim * fp
-        output_size = length * ffn_dim * fp
-    elif layer_name == "up_proj": # only for llama
-        input_size = length * ffn_dim * fp # original "length * n_embd * fp" but to match gate_proj output
-        weight_size = n_embd * ffn_dim * fp
-        output_size = length * ffn_dim * fp
-    elif layer_name == "fc1":
-        input_size = length * n_embd * fp
-        weight_size = n_embd * ffn_dim * fp
-        output_size = length * ffn_dim * fp
-    elif layer_name == "act_fn":
-        input_size = length * ffn_dim * fp
-        weight_size = 0
-        output_size = length * ffn_dim * fp
-    elif layer_name == "down_proj": # only for llama
-        input_size = length * ffn_dim * fp
-        weight_size = ffn_dim * n_embd * fp
-        output_size = length * n_embd * fp
-    elif layer_name == "fc2":
-        input_size = length * ffn_dim * fp
-        weight_size = ffn_dim * n_embd * fp
-        output_size = length * n_embd * fp
-    elif layer_name == "lm_head":
-        input_size = length * n_embd * fp
-        weight_size = n_embd * vocab_size * fp
-        output_size = length * vocab_size * fp
+        input_size = nh * length * total * fp + int(kv * total * kv_fp) # s (output of Softmax) + v (cache + chunk)
+        output_size = nh * length * hd * fp
     else:
+        return calculate_sizes(model, layer_name, length, True, fp, kv_fp)
+    return input_size, 0, output_size
+
+# calculate_sizes for an array of lengths, returns arrays of input, weight, output sizes
+def calculate_sizes_array(model, layer_name, lengths, init=False, fp=2, kv_fp=None):
+    lengths = np.asarray(lengths, dtype=np.int64)
+    sizes = get_model_spec(model).sizes.get((layer_name, bool(init)))
+    if sizes == None:
         print(f"ERROR: calculate_sizes: No matching layer name {layer_name} found for model {model}")
-        input_size = 0
-        weight_size = 0
-        output_size = 0
-    return input_size, weight_size, output_size
\ No newline at end of file
+        sizes = [(0, 0, 0)] * 4
+    if kv_fp == None:
+        kv_fp = fp
+    input, weight, output, kv = ((a * lengths * lengths + b * lengths + c) for a, b, c in sizes)
+    return input * fp + (kv * kv_fp).astype(np.int64), weight * fp, output * fp
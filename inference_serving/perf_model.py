@@ -0,0 +1,222 @@
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+
+# perf models loaded in this process, keyed by hardware
+_perf_models = {}
+# the workload pipeline loads them from its worker thread too
+_perf_models_lock = threading.Lock()
+
+# how to estimate the latency of (input, kv_cache) points missing in the perf model
+# linear: piecewise-linear, loglog: piecewise-linear in log-log space, none: profiled points only
+INTERP_MODES = ['linear', 'loglog', 'none']
+
+# compiled perf model: {hardware}.npy is a structured array of (key, latency) sorted by key
+# {hardware}.json holds the names of models, hardware and layers that the key refers to
+# key bits: model (8) | hardware (8) | layer_name (8) | input (20) | kv_cache (20)
+_NAME_BITS = 8
+_LEN_BITS = 20
+_LEN_MASK = (1 << _LEN_BITS) - 1
+
+# in-memory perf model of one hardware
+# rows of perf_model/{hardware}.csv are indexed by (model, hardware, layer_name, input, kv_cache)
+# a compiled perf_model/{hardware}.npy is memory-mapped instead when it is not older than the csv file
+class PerfModel():
+    def __init__(self, hardware, path=None):
+        self.hardware = hardware
+        if path == None:
+            path = get_perf_model_path(hardware)
+        self.path = path
+        self.curves = {}
+
+        if path.endswith('.npy'):
+            with open(path[:-len('.npy')] + '.json', 'r') as f:
+                names = json.load(f)
+            self.names = {kind: {name: i for i, name in enumerate(names[kind])} for kind in ['model', 'hardware', 'layer_name']}
+            table = np.load(path, mmap_mode='r')
+            self.keys = table['key']
+            self.latencies = table['latency']
+            self.index = None
+        else:
+            df = pd.read_csv(path, sep=',')
+            keys = zip(df['model'].tolist(), df['hardware'].tolist(), df['layer_name'].tolist(), df['input'].tolist(), df['kv_cache'].tolist())
+            self.index = dict(zip(keys, df['latency(ns)'].tolist()))
+            self.df = df
+
+    # latency of one layer
+    def lookup(self, model, layer_name, input, kv_cache=0, interp='linear'):
+        return self.lookup_batch(model, [(layer_name, input, kv_cache)], interp)[0]
+
+    # latency of every (layer_name, input, kv_cache) in keys
+    # missing points are interpolated per layer, all points of a layer in one call
+    def lookup_batch(self, model, keys, interp='linear'):
+        latencies = self.find(model, keys)
+        missing = {} # (layer_name, axis) -> [(position, x)]
+        for pos, (layer_name, input, kv_cache) in enumerate(keys):
+            if latencies[pos] != None:
+                continue
+            key = (model, self.hardware, layer_name, input, kv_cache)
+            if interp == 'none':
+                raise KeyError(f"PerfModel: no entry for {key} in {self.path}")
+            # prefill rows are profiled along input, decode rows along kv_cache
+            if kv_cache == 0:
+                axis, x = 'input', input
+            elif input == 1:
+                axis, x = 'kv_cache', kv_cache
+            else:
+                raise KeyError(f"PerfModel: cannot interpolate {key}, only prefill (kv_cache == 0) or decode (input == 1) rows are profiled")
+            missing.setdefault((layer_name, axis), []).append((pos, x))
+
+        for (layer_name, axis), points in missing.items():
+            values = self.interpolate(model, layer_name, axis, [x for _, x in points], interp)
+            for (pos, _), value in zip(points, values.tolist()):
+                latencies[pos] = value
+        return latencies
+
+    # profiled latencies of keys, None where the point is not profiled
+    def find(self, model, keys):
+        if self.index != None:
+            index = self.index
+            hardware = self.hardware
+            return [index.get((model, hardware, layer_name, input, kv_cache)) for layer_name, input, kv_cache in keys]
+
+        # compiled perf model, binary search of all keys at once
+        latencies = [None] * len(keys)
+        codes = []
+        positions = []
+        for pos, (layer_name, input, kv_cache) in enumerate(keys):
+            code = self.encode(model, layer_name, input, kv_cache)
+            if code != None:
+                codes.append(code)
+                positions.append(pos)
+        if len(codes) == 0 or len(self.keys) == 0:
+            return latencies
+        codes = np.array(codes, dtype=np.uint64)
+        found = np.minimum(np.searchsorted(self.keys, codes), len(self.keys) - 1)
+        hits = (self.keys[found] == codes).tolist()
+        values = self.latencies[found].tolist()
+        for pos, hit, value in zip(positions, hits, values):
+            if hit:
+                latencies[pos] = value
+        return latencies
+
+    # key of the compiled perf model, None if a name is unknown or a length is out of range
+    def encode(self, model, layer_name, input, kv_cache):
+        names = self.names
+        if model not in names['model'] or self.hardware not in names['hardware'] or layer_name not in names['layer_name']:
+            return None
+        if input > _LEN_MASK or kv_cache > _LEN_MASK:
+            return None
+        return get_key(names['model'][model], names['hardware'][self.hardware], names['layer_name'][layer_name], input, kv_cache)
+
+    # profiled points of a layer along an axis, sorted by x
+    def get_curve(self, model, layer_name, axis):
+        curve = (model, layer_name, axis)
+        if curve not in self.curves:
+            if self.index != None:
+                df = self.df
+                rows = df[(df['model'] == model) & (df['hardware'] == self.hardware) & (df['layer_name'] == layer_name)]
+                inputs = rows['input'].to_numpy(dtype=np.int64)
+                kv_caches = rows['kv_cache'].to_numpy(dtype=np.int64)
+                ys = rows['latency(ns)'].to_numpy(dtype=np.float64)
+            else:
+                # rows of a layer are contiguous in the compiled perf model
+                lo = self.encode(model, layer_name, 0, 0)
+                if lo == None:
+                    lo = hi = 0
+                else:
+                    lo, hi = np.searchsorted(self.keys, np.array([lo, lo + (1 << 2 * _LEN_BITS)], dtype=np.uint64)).tolist()
+                keys = np.asarray(self.keys[lo:hi])
+                inputs = ((keys >> np.uint64(_LEN_BITS)) & np.uint64(_LEN_MASK)).astype(np.int64)
+                kv_caches = (keys & np.uint64(_LEN_MASK)).astype(np.int64)
+                ys = np.asarray(self.latencies[lo:hi], dtype=np.float64)
+
+            if axis == 'input':
+                mask = kv_caches == 0
+                xs = inputs[mask]
+            else:
+                mask = (inputs == 1) & (kv_caches > 0)
+                xs = kv_caches[mask]
+            xs, first = np.unique(xs.astype(np.float64), return_index=True)
+            self.curves[curve] = (xs, ys[mask][first])
+        return self.curves[curve]
+
+    # estimate latencies of a layer at xs from its profiled points
+    # outside of the profiled range, the first/last segment is extrapolated
+    def interpolate(self, model, layer_name, axis, xs, interp='linear'):
+        xp, yp = self.get_curve(model, layer_name, axis)
+        if len(xp) == 0:
+            raise KeyError(f"PerfModel: no {axis} profile of {layer_name} for {model} in {self.path}")
+        x = np.asarray(xs, dtype=np.float64)
+        if interp == 'loglog':
+            xp, yp, x = np.log(xp), np.log(np.maximum(yp, 1)), np.log(x)
+
+        y = np.interp(x, xp, yp)
+        if len(xp) > 1:
+            lo = x < xp[0]
+            hi = x > xp[-1]
+            y[lo] = yp[0] + (x[lo] - xp[0]) * (yp[1] - yp[0]) / (xp[1] - xp[0])
+            y[hi] = yp[-1] + (x[hi] - xp[-1]) * (yp[-1] - yp[-2]) / (xp[-1] - xp[-2])
+
+        if interp == 'loglog':
+            y = np.exp(y)
+        return np.maximum(np.rint(y), 0).astype(np.int64)
+
+
+# get perf model of the hardware, loaded once per process
+def get_perf_model(hardware):
+    with _perf_models_lock:
+        if hardware not in _perf_models:
+            _perf_models[hardware] = PerfModel(hardware)
+        return _perf_models[hardware]
+
+# compiled perf model if it is up to date, csv file otherwise
+def get_perf_model_path(hardware, perf_dir="../perf_model"): # relative to astra-sim folder
+    csv_path = os.path.join(perf_dir, f"{hardware}.csv")
+    npy_path = os.path.join(perf_dir, f"{hardware}.npy")
+    if os.path.exists(npy_path) and (not os.path.exists(csv_path) or os.path.getmtime(npy_path) >= os.path.getmtime(csv_path)):
+        return npy_path
+    return csv_path
+
+# key of a row in the compiled perf model, works on numpy arrays too
+def get_key(model_id, hardware_id, layer_id, input, kv_cache):
+    key = ((model_id << _NAME_BITS) | hardware_id) << _NAME_BITS | layer_id
+    return (((key << _LEN_BITS) | input) << _LEN_BITS) | kv_cache
+
+# compile a perf model csv into {output}.npy and {output}.json, returns the npy path
+# output defaults to the csv path without extension
+def compile_perf_model(csv_path, output=None):
+    if output == None:
+        output = os.path.splitext(csv_path)[0]
+    df = pd.read_csv(csv_path, sep=',')
+
+    names = {}
+    ids = {}
+    for kind in ['model', 'hardware', 'layer_name']:
+        names[kind] = sorted(df[kind].unique().tolist())
+        if len(names[kind]) > 1 << _NAME_BITS:
+            raise ValueError(f"compile_perf_model: more than {1 << _NAME_BITS} {kind} names in {csv_path}")
+        ids[kind] = df[kind].map({name: i for i, name in enumerate(names[kind])}).to_numpy(dtype=np.uint64)
+    inputs = df['input'].to_numpy(dtype=np.uint64)
+    kv_caches = df['kv_cache'].to_numpy(dtype=np.uint64)
+    if len(df) > 0 and max(inputs.max(), kv_caches.max()) > _LEN_MASK:
+        raise ValueError(f"compile_perf_model: input or kv_cache larger than {_LEN_MASK} in {csv_path}")
+
+    shift = np.uint64
+    keys = ((ids['model'] << shift(_NAME_BITS)) | ids['hardware']) << shift(_NAME_BITS) | ids['layer_name']
+    keys = (((keys << shift(_LEN_BITS)) | inputs) << shift(_LEN_BITS)) | kv_caches
+    latency = df['latency(ns)'].to_numpy()
+    table = np.empty(len(df), dtype=[('key', '<u8'), ('latency', '<i8' if latency.dtype.kind in 'iu' else '<f8')])
+    order = np.argsort(keys, kind='stable')
+    table['key'] = keys[order]
+    table['latency'] = latency[order]
+    # duplicated rows: the last one wins, same as the csv index
+    last = np.append(table['key'][1:] != table['key'][:-1], True)
+    table = table[last]
+
+    with open(output + '.json', 'w') as f:
+        json.dump(names, f)
+    np.save(output + '.npy', table)
+    return output + '.npy'
@@ -0,0 +1,100 @@
+from copy import copy
+from concurrent.futures import ThreadPoolExecutor
+from .request import *
+from .utils import *
+from .generate_graph import *
+from .generate_trace import *
+
+# makes trace and workload of the batch, reusing the trace cache if it is given
+def prepare_workload(batch, hardware, npu_num, npu_group, fp=16, interp='linear', trace_cache=None):
+    key = None
+    if trace_cache != None:
+        key = trace_cache.get_key(batch, hardware, npu_num, npu_group, fp, interp)
+        batch.workload = trace_cache.lookup(key)
+        if batch.workload != None:
+            return
+    generate_trace(batch, hardware, npu_num, npu_group, fp, interp)
+    generate_graph(batch, hardware, npu_num)
+    if trace_cache != None:
+        batch.workload = trace_cache.store(key, get_trace_path(batch, hardware), get_workload(batch, hardware))
+
+
+# prepares the workload of the next batch while AnalyticalAstra runs the current one
+# only decode iterations are predicted, when no request arrives or finishes the next batch is the same requests one token longer
+class WorkloadPipeline():
+    def __init__(self, hardware, npu_num, npu_group, fp=16, interp='linear', trace_cache=None, latency_memo=None, verbose=False):
+        self.hardware = hardware
+        self.npu_num = npu_num
+        self.npu_group = npu_group
+        self.fp = fp
+        self.interp = interp
+        self.trace_cache = trace_cache
+        self.latency_memo = latency_memo # batches that will be replayed need no workload
+        self.verbose = verbose
+
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.prediction = None # (predicted batch, future)
+        self.last_start = -1
+        self.latency = 0 # last iteration latency, used to guess the next arrivals
+        self.hits = 0
+        self.misses = 0
+
+    # predict the batch after this one and start preparing it
+    def prefetch(self, batch, scheduler, current):
+        if self.last_start >= 0:
+            self.latency = current - self.last_start
+        self.last_start = current
+
+        # speculative decoding advances a random number of tokens
+        if batch.load != 0 or batch.evict != 0 or batch.spec_k != 0:
+            return
+        for req in batch.requests:
+            # prefill iteration or request finishes
+            if req.is_init or req.input + 1 >= req.output:
+                return
+        # other batches or requests can join the next batch
+        if len(scheduler.inflight) != 1 or scheduler.has_ready_request(current + self.latency):
+            return
+
+        predicted = Batch(scheduler.batch_ids + 1, batch.model, batch.input, 0, batch.batch_size, current, 0)
+        predicted.kv_dtype = batch.kv_dtype
+        for req in batch.requests:
+            req = copy(req)
+            req.input += 1
+            predicted.requests.append(req)
+        # the next iteration may need eviction
+        if not scheduler.memory.mem_avail(scheduler.memory.get_block_kv(predicted.requests, len(predicted.requests))):
+            return
+        if self.latency_memo != None and self.latency_memo.has(predicted):
+            return
+
+        future = self.executor.submit(prepare_workload, predicted, self.hardware, self.npu_num, self.npu_group, self.fp, self.interp, self.trace_cache)
+        self.prediction = (predicted, future)
+        if self.verbose:
+            print(f"Pipeline: preparing predicted batch #{predicted.batch_id}")
+
+    # use the prepared workload if the prediction was right, returns True on hit
+    def take(self, batch):
+        if self.prediction == None:
+            return False
+        predicted, future = self.prediction
+        self.prediction = None
+        # wait even on miss, the prepared files are overwritten by the actual batch
+        future.result()
+
+        if predicted.batch_id == batch.batch_id and predicted.get_signature() == batch.get_signature():
+            batch.workload = get_workload(predicted, self.hardware)
+            self.hits += 1
+            if self.verbose:
+                print(f"Pipeline: batch #{batch.batch_id} was prepared")
+            return True
+        self.misses += 1
+        if self.verbose:
+            print(f"Pipeline: prediction of batch #{batch.batch_id} missed")
+        return False
+
+    def shutdown(self):
+        if self.prediction != None:
+            self.prediction[1].result()
+            self.prediction = None
+        self.executor.shutdown()
@@ -0,0 +1,58 @@
+from abc import ABC, abstractmethod
+
+# scheduling policies of the Scheduler
+# a policy orders the waiting requests by key; with order_running, requests that already run are ordered by key too
+# requests at the end of the order are batched last and evicted first
+class SchedulingPolicy(ABC):
+    name = None
+    order_running = False
+
+    # smaller key is scheduled first
+    @abstractmethod
+    def key(self, req):
+        pass
+
+# first come first served
+class FCFS(SchedulingPolicy):
+    name = 'fcfs'
+
+    def key(self, req):
+        return (req.arrival,)
+
+# shortest prompt first
+class SJF(SchedulingPolicy):
+    name = 'sjf'
+
+    def key(self, req):
+        return (req.input, req.arrival)
+
+# shortest remaining output first
+class SRO(SchedulingPolicy):
+    name = 'sro'
+    order_running = True
+
+    def key(self, req):
+        return (req.output - req.input, req.arrival)
+
+# strict priority, smaller priority value first
+class Priority(SchedulingPolicy):
+    name = 'priority'
+    order_running = True
+
+    def key(self, req):
+        return (req.priority, req.arrival)
+
+# earliest deadline first, requests without deadline last
+class EDF(SchedulingPolicy):
+    name = 'edf'
+    order_running = True
+
+    def key(self, req):
+        return (req.deadline if req.deadline >= 0 else float('inf'), req.arrival)
+
+
+POLICIES = {policy.name: policy for policy in [FCFS, SJF, SRO, Priority, EDF]}
+
+# name is one of POLICIES, checked by the choices of --policy
+def get_policy(name):
+    return POLICIES[name]()
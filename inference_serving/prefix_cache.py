@@ -0,0 +1,83 @@
+from collections import OrderedDict
+
+# automatic prefix caching of kv blocks, vLLM style
+# a full block of a shared prefix is identified by hash of (prefix id, block index) and shared by every request that refers to it
+# blocks without references stay in memory until they are evicted in least recently used order
+class PrefixCache():
+    def __init__(self, block_size, verbose=False):
+        self.block_size = block_size
+        self.verbose = verbose
+        self.blocks = {} # hash -> reference count
+        self.free = OrderedDict() # hash of unreferenced blocks, least recently used first
+        # statistics
+        self.queries = 0 # prefix blocks looked up
+        self.hits = 0 # prefix blocks found
+        self.saved_tokens = 0 # prefill tokens not computed
+        self.shared_blocks = 0 # blocks that were not allocated again
+
+    # number of full prefix blocks of the request, the last prompt token is always computed
+    def get_num_blocks(self, req):
+        if req.prefix_id < 0:
+            return 0
+        return min(req.prefix_len, req.input - 1) // self.block_size
+
+    def get_hash(self, req, i):
+        return hash((req.prefix_id, i))
+
+    # reference the cached leading prefix blocks of the request, returns the number of them
+    def acquire(self, req):
+        num_blocks = self.get_num_blocks(req)
+        hits = 0
+        while hits < num_blocks and self.get_hash(req, hits) in self.blocks:
+            self.ref(self.get_hash(req, hits))
+            hits += 1
+        req.prefix_blocks = hits
+        return hits
+
+    # the request acquired its blocks and was batched
+    def commit(self, req):
+        self.queries += self.get_num_blocks(req)
+        self.hits += req.prefix_blocks
+        self.saved_tokens += req.prefix_blocks * self.block_size
+        self.shared_blocks += req.prefix_blocks
+
+    # add computed prefix blocks of the request until num_computed tokens
+    # returns the number of blocks that were cached by another request in the meantime (their copy can be freed)
+    def insert(self, req, num_computed):
+        num_blocks = min(self.get_num_blocks(req), num_computed // self.block_size)
+        dup = 0
+        for i in range(req.prefix_blocks, num_blocks):
+            block = self.get_hash(req, i)
+            if block in self.blocks:
+                dup += 1
+                self.ref(block)
+            else:
+                self.blocks[block] = 1
+        req.prefix_blocks = max(req.prefix_blocks, num_blocks)
+        self.shared_blocks += dup
+        return dup
+
+    # drop the references of the request
+    def release(self, req):
+        for i in range(req.prefix_blocks):
+            block = self.get_hash(req, i)
+            self.blocks[block] -= 1
+            if self.blocks[block] == 0:
+                self.free[block] = True
+        req.prefix_blocks = 0
+
+    def ref(self, block):
+        if self.blocks[block] == 0:
+            del self.free[block]
+        self.blocks[block] += 1
+
+    # evict up to num_blocks unreferenced blocks, returns the number of evicted blocks
+    def evict(self, num_blocks):
+        evicted = 0
+        while evicted < num_blocks and len(self.free) != 0:
+            block, _ = self.free.popitem(last=False)
+            del self.blocks[block]
+            evicted += 1
+        if self.verbose and evicted > 0:
+            print(f"PrefixCache: evicted {evicted} blocks")
+        return evicted
@@ -9,6 +9,23 @@ class Request:
         self.is_init = is_init
         self.original_input = input
         self.evict = False
+        self.recompute = False # prefilling again after recompute preemption
+        self.last_run = -1 # time of the last batch that ran the request
+        # prefix caching
+        self.prefix_id = -1 # shared prefix of the prompt, -1: none
+        self.prefix_len = 0 # tokens of the shared prefix
+        self.prefix_blocks = 0 # kv blocks referenced in the prefix cache
+        # chunked prefill
+        self.prefilled = 0 # prompt tokens already in the kv cache
+        self.chunk = 0 # prompt tokens to prefill in the current iteration, 0: the rest of the prompt
+        # scheduling policy
+        self.priority = 0 # smaller is scheduled first
+        self.deadline = -1 # time to finish the request, -1: none
+        # service level objectives in ns, 0: none
+        self.slo_ttft = 0
+        self.slo_tpot = 0
+        # speculative decoding
+        self.acceptance = -1 # probability that a draft token is accepted, -1: default of the scheduler
         self.end_time = -1
         self.latency = -1
         self.queuing_delay = -1
@@ -28,6 +45,22 @@ class Request:
         del self.original_input
         del self.is_init
         del self.evict
+        del self.recompute
+        del self.last_run
+        del self.prefix_id
+        del self.prefix_len
+        del self.prefix_blocks
+        del self.prefilled
+        del self.chunk
+        del self.priority
+        del self.deadline
+        del self.slo_ttft
+        del self.slo_tpot
+        del self.acceptance
+
+    # prompt tokens prefilled in the current iteration
+    def get_chunk(self):
+        return self.chunk if self.chunk != 0 else self.input - self.prefilled
 
     def set_que_delay(self, current):
         self.queuing_delay = current - self.arrival
@@ -45,12 +78,41 @@ class Batch:
         self.init_cnt = init_cnt
         self.batch_size = batch_size
         self.batch_time = batch_time
-        self.fired = [] # systems that fired this batch
+        self.fired = 0 # bitset of systems that fired this batch
         self.requests = []
-        self.end = []
+        self.end = 0 # bitset of systems that finished this batch
+        self.end_cnt = 0
         # ORCA
         self.is_orca = is_orca
         # vllm
         self.kv_size = kv_size
         self.evict = evict
         self.load = load
+        # workload path to run, set when it is not the default one (e.g. cached)
+        self.workload = None
+        # speculative decoding: draft model runs spec_k steps, the model verifies spec_k + 1 tokens of each decode request
+        self.draft_model = None
+        self.spec_k = 0
+        # precision of the kv cache (KV_DTYPES), None: same as the model
+        self.kv_dtype = None
+        # ns the iteration waits for kv caches read from the SSD tier of the kv store
+        self.kv_delay = 0
+
+    # mark the system fired, False if it already fired this batch
+    def fire(self, sys):
+        if self.fired >> sys & 1:
+            return False
+        self.fired |= 1 << sys
+        return True
+
+    # mark the system finished, False if it already finished this batch
+    def finish(self, sys):
+        if self.end >> sys & 1:
+            return False
+        self.end |= 1 << sys
+        self.end_cnt += 1
+        return True
+
+    # everything of the batch that changes its trace, the last field is a tuple per request
+    def get_signature(self):
+        return (self.model, self.input, self.load, self.evict, self.draft_model, self.spec_k, self.kv_dtype, self.kv_delay, tuple((req.input, req.is_init, req.prefilled, req.chunk) for req in self.requests))
@@ -14,7 +14,7 @@ class RequestAPI:
         self.scheduler = scheduler
         self.request_queue = []
         
-    def add_request(self, model, input_length, output_length, arrival_time=None):
+    def add_request(self, model, input_length, output_length, arrival_time=None, priority=0, deadline=-1, prefix_id=-1, prefix_len=0, slo_ttft=-1, slo_tpot=-1):
         """
         Add a new request to the scheduler
         
@@ -23,11 +23,18 @@ class RequestAPI:
             input_length: Input sequence length
             output_length: Output sequence length  
             arrival_time: Request arrival time (default: current time)
+            priority: Priority of the scheduling policy, smaller is scheduled first (default: 0)
+            deadline: Time to finish the request in ns after arrival, -1 for none (default: -1)
+            prefix_id: Id of the shared prompt prefix for prefix caching, -1 for none (default: -1)
+            prefix_len: Length of the shared prompt prefix in tokens (default: 0)
+            slo_ttft: TTFT SLO in ns, 0 for none, -1 for the default of the scheduler (default: -1)
+            slo_tpot: TPOT SLO in ns, 0 for none, -1 for the default of the scheduler (default: -1)
         """
         if arrival_time is None:
             arrival_time = int(time.time() * 1e9)  # Current time in nanoseconds
             
-        self.scheduler.add_request([model, input_length, output_length, arrival_time])
+        self.scheduler.add_request([model, input_length, output_length, arrival_time], priority=priority, deadline=deadline,
+                                    prefix_id=prefix_id, prefix_len=prefix_len, slo_ttft=slo_ttft, slo_tpot=slo_tpot)
         print(f"Added request: input_len={input_length}, output_len={output_length}")
         
     def add_batch_requests(self, requests):
@@ -35,26 +42,34 @@ class RequestAPI:
         Add multiple requests at once
         
         Args:
-            requests: List of request dictionaries with keys: model, input_length, output_length, arrival_time
+            requests: List of request dictionaries with keys: model, input_length, output_length, arrival_time, priority, deadline, prefix_id, prefix_len, slo_ttft, slo_tpot
         """
         for req in requests:
             self.add_request(
                 req.get('model'),
                 req.get('input_length'),
                 req.get('output_length'),
-                req.get('arrival_time')
+                req.get('arrival_time'),
+                req.get('priority', 0),
+                req.get('deadline', -1),
+                req.get('prefix_id', -1),
+                req.get('prefix_len', 0),
+                req.get('slo_ttft', -1),
+                req.get('slo_tpot', -1)
             )
             
     def get_status(self):
         """Get current status of the scheduler"""
         return {
-            'pending_requests': len(self.scheduler.request),
+            'pending_requests': self.scheduler.get_num_request(),
             'inflight_batches': len(self.scheduler.inflight),
             'completed_requests': len(self.scheduler.done),
             'memory_usage': {
                 'total': self.scheduler.memory.npu_mem,
                 'used': self.scheduler.memory.used_mem,
-                'available': self.scheduler.memory.npu_mem - self.scheduler.memory.used_mem
+                'available': self.scheduler.memory.npu_mem - self.scheduler.memory.used_mem,
+                'blocks': self.scheduler.memory.allocator.num_blocks,
+                'free_blocks': self.scheduler.memory.allocator.get_num_free()
             }
         }
         
@@ -0,0 +1,58 @@
+import random
+from abc import ABC, abstractmethod
+
+# routers of the multi-replica simulation
+# a router picks the replica (Scheduler) that serves an arriving request
+class Router(ABC):
+    name = None
+
+    # index of the replica in replicas
+    @abstractmethod
+    def route(self, req, replicas):
+        pass
+
+# replicas in turn
+class RoundRobin(Router):
+    name = 'round_robin'
+
+    def __init__(self):
+        self.next = 0
+
+    def route(self, req, replicas):
+        i = self.next % len(replicas)
+        self.next += 1
+        return i
+
+# fewest prompt and output tokens left to process
+class LeastTokens(Router):
+    name = 'least_tokens'
+
+    def route(self, req, replicas):
+        return min(range(len(replicas)), key=lambda i : (replicas[i].get_outstanding_tokens(), i))
+
+# lowest kv cache usage, fewest outstanding tokens on a tie
+class KVAware(Router):
+    name = 'kv_aware'
+
+    def route(self, req, replicas):
+        return min(range(len(replicas)), key=lambda i : (replicas[i].memory.used_mem - replicas[i].memory.weight, replicas[i].get_outstanding_tokens(), i))
+
+# less loaded of two random replicas
+class PowerOfTwo(Router):
+    name = 'power_of_two'
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+
+    def route(self, req, replicas):
+        if len(replicas) == 1:
+            return 0
+        choices = self.random.sample(range(len(replicas)), 2)
+        return min(choices, key=lambda i : (replicas[i].get_outstanding_tokens(), i))
+
+
+ROUTERS = {router.name: router for router in [RoundRobin, LeastTokens, KVAware, PowerOfTwo]}
+
+# name is one of ROUTERS, checked by the choices of --router
+def get_router(name):
+    return ROUTERS[name]()
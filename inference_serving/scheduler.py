@@ -1,6 +1,11 @@
 import pandas as pd
 from time import time
 import csv
+import heapq
+import random
+from collections import deque
+from itertools import islice
+from bisect import bisect_right
 
 from .request import *
 from .utils import *
@@ -9,10 +14,16 @@ from .memory_model import *
 from .generate_graph import *
 from .generate_trace import *
 from .pim import *
+from .policy import *
+from .eviction import *
+from .kv_store import *
 
 # class that shedules request of astra-sim
 class Scheduler:
-    def __init__(self, model, max_batch, npu_num, npu_group, npu_mem, fp, block_size, req_num, verbose=False):
+    def __init__(self, model, max_batch, npu_num, npu_group, npu_mem, fp, block_size, req_num, verbose=False, max_num_batched_tokens=0, policy='fcfs',
+                 preemption='swap', hardware='RTX3090', remote_bw=512, interp='linear', prefix_caching=False, draft_model=None, spec_k=4, spec_acceptance=0.7,
+                 slo_ttft=0, slo_tpot=0, admission='none', eviction='last', kv_dtype=None, host_mem=0, ssd_mem=0, ssd_bw=4, kv_demotion='lru',
+                 kv_promotion='lazy', kv_prefetch=2):
         # all time realated variables are in using tick (system tick)
         # LLMServingSim uses Orca, vLLM technique at deafult
         self.model = model
@@ -20,15 +31,63 @@ class Scheduler:
         self.npu_num = npu_num
         self.npu_group = npu_group
         self.req_num = req_num
-        # lists are sorted in arrival time manner
-        self.request = [] # list of requests
-        self.inflight = [] # list of batches
+        # chunked prefill: max # of tokens in an iteration, 0: whole prompts are prefilled at once
+        self.max_num_batched_tokens = max_num_batched_tokens
+        # preemption when memory runs out, swap: kv cache to remote memory, recompute: drop and prefill again
+        # auto: cheaper one for each request, transfer over remote_bw (GB/s) versus prefill latency on hardware
+        self.preemption = preemption
+        self.hardware = hardware
+        self.remote_bw = remote_bw
+        self.interp = interp
+        self.swaps = 0
+        self.recomputes = 0
+        self.swap_fallbacks = 0 # swaps recomputed because the kv store was full, counted in recomputes
+        self.recomputed_tokens = 0
+        # victim policy of preemption
+        self.eviction = get_eviction_policy(eviction)
+        self.evicted_bytes = 0 # kv cache swapped out to remote memory
+        self.loaded_bytes = 0 # kv cache swapped back in
+        # swapped out kv cache is kept in host memory (host_mem GB per NPU, 0: unlimited) and an optional SSD (ssd_mem GB per NPU at ssd_bw GB/s)
+        self.kv_store = TieredKVStore(int(host_mem * 1000000000), remote_bw, int(ssd_mem * 1000000000), ssd_bw, kv_demotion, kv_promotion, kv_prefetch, verbose)
+        # speculative decoding with the draft model: each decode request advances by the accepted draft tokens + 1
+        # draft tokens are accepted one by one with probability spec_acceptance (or acceptance of the request)
+        self.draft_model = draft_model
+        self.spec_k = spec_k if draft_model != None else 0
+        self.spec_acceptance = spec_acceptance
+        self.random = random.Random(0)
+        self.spec_steps = 0 # decode iterations of requests
+        self.spec_tokens = 0 # tokens generated in them
+        # service level objectives of requests without their own, in ns (0: none)
+        # admission control of arriving requests that cannot meet their SLO, none: admit all, reject: drop, defer: run when nothing else waits
+        self.slo_ttft = slo_ttft
+        self.slo_tpot = slo_tpot
+        self.admission = admission
+        self.deferred = deque() # deferred requests in arrival order
+        self.rejected = [] # list of rejected requests
+        self.defers = 0
+        self.slo_requests = 0 # requests with an SLO
+        self.good = 0 # done requests that met their SLO
+        self.iteration_latency = 0 # latency of the last decode iteration, estimates TPOT
+        self.queued_prompt = 0 # prompt tokens to prefill of the waiting and ready requests
+        self.busy_until = 0 # estimated end of the inflight batches
+        # scheduling policy that orders waiting (and running) requests
+        self.policy = get_policy(policy)
+        # requests to be batched: ready ones were already batched and run before waiting ones
+        self.pending = [] # heap of (arrival, id, request) that have not arrived yet
+        self.waiting = [] # heap of (policy key, id, request) that arrived but have never been batched
+        # requests returned from finished batches, in scheduling order
+        # with order_running, a heap of (policy key, id, request) like waiting, keyed when the request returns from its batch
+        self.ready = [] if self.policy.order_running else deque()
+        self.index = {} # id -> request in pending, waiting or ready
+        self.inflight = {} # batch id -> batch, in scheduling order
         self.done = [] # list of requests
         self.req_ids = -1
         self.batch_ids = -1
+        # prefill pool of disaggregated serving: requests that finished prefill, decoded in the decode pool
+        self.handoff = None
 
         # memory model
-        self.memory = MemoryModel(model, npu_num, npu_mem, block_size, fp, verbose)
+        self.memory = MemoryModel(model, npu_num, npu_mem, block_size, fp, verbose, prefix_caching, draft_model, self.spec_k, kv_dtype)
 
         # verbose
         self.verbose = verbose
@@ -44,8 +103,20 @@ class Scheduler:
             input_length = int(row['input_toks'])
             output_length = int(row['input_toks'] + row['output_toks'])
             arrival_time_ns = int(row['arrival_time_ns'])
+            # optional columns for the scheduling policy
+            priority = int(row['priority']) if 'priority' in row else 0
+            deadline_ns = int(row['deadline_ns']) if 'deadline_ns' in row else -1
+            # optional columns for prefix caching
+            prefix_id = int(row['prefix_id']) if 'prefix_id' in row else -1
+            prefix_len = int(row['prefix_toks']) if 'prefix_toks' in row else 0
+            # optional column for speculative decoding
+            acceptance = float(row['acceptance']) if 'acceptance' in row else -1
+            # optional columns for service level objectives
+            slo_ttft = int(row['slo_ttft_ns']) if 'slo_ttft_ns' in row else -1
+            slo_tpot = int(row['slo_tpot_ns']) if 'slo_tpot_ns' in row else -1
             
-            self.add_request([self.model, input_length, output_length, arrival_time_ns], is_init=is_init)
+            self.add_request([self.model, input_length, output_length, arrival_time_ns], is_init=is_init, priority=priority, deadline=deadline_ns,
+                             prefix_id=prefix_id, prefix_len=prefix_len, acceptance=acceptance, slo_ttft=slo_ttft, slo_tpot=slo_tpot)
             cnt+=1
         if self.verbose:
             print(f"Scheduler: added {cnt} requests to LLMServingSim")
@@ -56,7 +127,8 @@ class Scheduler:
         # first NPU to process new batch
         if sys == 0:
             # nothing to batch return None
-            if len(self.request) != 0 and self.request[0].arrival > current:
+            self.admit(current)
+            if len(self.ready) == 0 and len(self.waiting) == 0:
                 return None
             # constraint of inflight batches considering parallelism
             if len(self.inflight) >= self.npu_group:
@@ -64,95 +136,189 @@ class Scheduler:
                 return None
 
             # scheduling start
-            batch_req = [req for req in self.request if req.arrival <= current]
-            batch_len = len(batch_req) if len(batch_req) <= self.max_batch else self.max_batch
+            # ready requests first, then waiting requests in policy order
+            running = []
+            if self.policy.order_running:
+                running = [heapq.heappop(self.ready) for _ in range(min(self.max_batch, len(self.ready)))]
+                batch_req = [req for _, _, req in running]
+            else:
+                batch_req = list(islice(self.ready, min(self.max_batch, len(self.ready))))
+            arrived = []
+            while len(batch_req) + len(arrived) < self.max_batch and len(self.waiting) != 0:
+                arrived.append(heapq.heappop(self.waiting))
+            batch_req += [req for _, _, req in arrived]
+            candidates = batch_req
+            # cached prefix blocks count as prefilled
+            matched = self.match_prefix(batch_req)
+            if self.max_num_batched_tokens > 0:
+                batch_req = self.apply_token_budget(batch_req)
+            batch_len = len(batch_req)
 
             # nothing to batch
             if batch_len == 0:
+                for item in running:
+                    heapq.heappush(self.ready, item)
                 return None
 
-            # can make batch and proceed
-            batch_req = batch_req[:batch_len]
-
             kv_size = 0
             evict_size = 0
             gen_req = [req for req in batch_req if not req.is_init]
             # check if there is request that need to enlarge the block
-            temp_len = batch_len
-            for i in range(batch_len, -1, -1):
-                kv_size = self.memory.get_block_kv(batch_req, i) # includes evicted input, and initiation input
-                if self.memory.mem_avail(kv_size):
-                    temp_len = i
-                    break
+            # kv_prefix[i]: kv cache to add when the first i requests are batched, includes evicted input, and initiation input
+            kv_prefix = self.memory.get_block_kv_prefix(batch_req)
+            temp_len, kv_size = self.get_admissible_len(kv_prefix, batch_len, batch_len)
+            # free unreferenced prefix blocks before preempting anything
+            if temp_len < batch_len and self.memory.evict_prefix_cache(kv_prefix[batch_len] - (self.memory.npu_mem - self.memory.used_mem)) > 0:
+                temp_len, kv_size = self.get_admissible_len(kv_prefix, batch_len, batch_len)
             
             # no memory to batch
             while temp_len == 0:
                 # preempt request one by one untill there is enough space
                 if len(gen_req) == 0:
+                    for item in running:
+                        heapq.heappush(self.ready, item)
+                    for item in arrived:
+                        heapq.heappush(self.waiting, item)
+                    self.unmatch_prefix(matched, set())
                     return None
                 
-                # check already evicted request
-                if gen_req[-1].evict:
+                if self.eviction.name == 'last':
+                    # check already evicted request
+                    if gen_req[-1].evict:
+                        gen_req = gen_req[:-1]
+                        continue
+
+                    # else
+                    victim = gen_req[-1]
                     gen_req = gen_req[:-1]
-                    continue
+                else:
+                    victims = [req for req in gen_req if not req.evict]
+                    if len(victims) == 0:
+                        gen_req = []
+                        continue
+                    # nothing fits, need is the memory missing for the first request
+                    victim = self.eviction.select(victims, self.memory, kv_prefix[1] - (self.memory.npu_mem - self.memory.used_mem))
+                    gen_req = [req for req in gen_req if req is not victim]
 
-                # else
-                evict_size = self.memory.get_evict_kv(gen_req[-1])
-                gen_req[-1].evict = True
-                if self.verbose:
-                    print(f"Sceduler: eviction of the request #{gen_req[-1].id}")
-                gen_req = gen_req[:-1]
-                self.memory.mem_store(evict_size)
+                preemption = self.get_preemption(victim)
+                if preemption == 'swap':
+                    victim_size = self.memory.get_evict_kv(victim)
+                    # the host and the SSD are full, the kv cache is dropped instead
+                    if not self.kv_store.store(victim, victim_size, current):
+                        preemption = 'recompute'
+                        self.swap_fallbacks += 1
+                        if self.verbose:
+                            print(f"Sceduler: no room in the kv store for the request #{victim.id}, recomputing it")
+                if preemption == 'recompute':
+                    # drop the kv cache, prompt and generated tokens are prefilled again
+                    self.memory.free(victim)
+                    if self.memory.prefix_cache != None:
+                        self.memory.prefix_cache.release(victim)
+                    victim.is_init = True
+                    victim.recompute = True
+                    victim.prefilled = 0
+                    victim.chunk = 0
+                    self.queued_prompt += victim.input
+                    self.recomputes += 1
+                    if self.verbose:
+                        print(f"Sceduler: recompute preemption of the request #{victim.id}")
+                else:
+                    evict_size += victim_size
+                    self.evicted_bytes += victim_size
+                    victim.evict = True
+                    self.swaps += 1
+                    if self.verbose:
+                        print(f"Sceduler: eviction of the request #{victim.id}")
+                    self.memory.free(victim)
 
-                if len(gen_req) < batch_len:
-                    batch_len = len(gen_req)
+                if self.eviction.name == 'last':
+                    if len(gen_req) < batch_len:
+                        batch_len = len(gen_req)
 
-                # check if can batch
-                for i in range(batch_len, -1, -1):
-                    kv_size = self.memory.get_block_kv(batch_req, i)
-                    if self.memory.mem_avail(kv_size):
-                        temp_len = i
-                        break
+                    # check if can batch
+                    # the evicted request is at or after batch_len in batch_req, kv_prefix[:batch_len + 1] is unchanged
+                    temp_len, kv_size = self.get_admissible_len(kv_prefix, batch_len, temp_len)
+                else:
+                    # the victim can be anywhere in batch_req
+                    batch_req = [req for req in batch_req if req is not victim]
+                    batch_len = min(batch_len, len(batch_req))
+                    kv_prefix = self.memory.get_block_kv_prefix(batch_req)
+                    temp_len, kv_size = self.get_admissible_len(kv_prefix, batch_len, temp_len)
 
             batch_len = temp_len
             batch_req = batch_req[:batch_len]
             load_size = 0
+            kv_delay = 0
 
-            # delete from request queue
-            for req in batch_req:
-                for i, req_ in enumerate(self.request):
-                    if req_.id == req.id:
-                        del self.request[i]
-                        break
+            # delete from request queue, unbatched requests stay in order and waiting ones go back to the heap
+            batched = set(req.id for req in batch_req)
+            num_ready = len(candidates) - len(arrived)
+            if self.policy.order_running:
+                for item in running:
+                    if item[1] not in batched:
+                        heapq.heappush(self.ready, item)
+            else:
+                for _ in range(num_ready):
+                    self.ready.popleft()
+                self.ready.extendleft(reversed([req for req in candidates[:num_ready] if req.id not in batched]))
+            for item in arrived:
+                if item[1] not in batched:
+                    heapq.heappush(self.waiting, item)
+            self.unmatch_prefix(matched, batched)
 
+            # allocate kv blocks of the batch
+            self.memory.allocate_batch(batch_req)
+
+            matched_ids = set(req.id for req in matched)
+            for req in batch_req:
+                del self.index[req.id]
+                if req.is_init:
+                    # the prompt was queued before its prefix blocks were matched
+                    self.queued_prompt -= req.input - (0 if req.id in matched_ids else req.prefilled)
                 if req.evict:
                     # load evicted kv cache
                     load_size += self.memory.get_evict_kv(req)
+                    self.loaded_bytes += self.memory.get_evict_kv(req)
+                    # reads from the SSD are serialized, the last one bounds the delay
+                    kv_delay = max(kv_delay, self.kv_store.load(req, current))
                     req.evict = False
                     if self.verbose:
                         print(f"Scheduler: loading the request #{req.id}")
 
-            # load memory
-            if kv_size > 0:
-                self.memory.mem_load(kv_size)
-            
             total_len = 0
             init_cnt = 0
+            prompt_len = 0
             for req in batch_req:
+                req.last_run = current
                 if req.is_init:
-                    total_len += req.input
+                    total_len += req.get_chunk()
+                    prompt_len += req.get_chunk()
                     init_cnt += 1
-                    req.set_que_delay(current)
+                    if req.queuing_delay == -1:
+                        req.set_que_delay(current)
                 else:
-                    total_len += 1
+                    total_len += self.spec_k + 1
+            if self.admission != 'none':
+                # decode part as the last decode iteration, prompts as their prefill
+                latency = self.iteration_latency + (self.get_prefill_latency(prompt_len) if prompt_len > 0 else 0)
+                self.busy_until = max(self.busy_until, current + latency)
 
             # make batch, output doesn't matter here!! always one iteration
             # batch is also 1
             batch = Batch(self.get_batch_id(), batch_req[0].model, total_len, init_cnt, '1', current, kv_size, evict_size, load_size, True)
             # add alredy fired system
-            batch.fired.append(sys)
+            batch.fire(sys)
             batch.requests.extend(batch_req)
-            self.inflight.append(batch)
+            if self.spec_k > 0:
+                batch.draft_model = self.draft_model
+                batch.spec_k = self.spec_k
+            batch.kv_dtype = self.memory.kv_dtype
+            batch.kv_delay = kv_delay
+            # kv caches of the next evicted requests are prefetched from the SSD while the batch runs
+            # ready is only walked while the SSD holds kv caches, up to the first prefetch evicted requests
+            if self.kv_store.can_prefetch():
+                self.kv_store.prefetch_requests(self.get_next_evicted(), current)
+            self.inflight[batch.batch_id] = batch
             if self.verbose:
                 print(f"Scheduler: scheduling new batch #{batch.batch_id} to sys[{sys}]")
                 print(f"Scheduler: batch #{batch.batch_id} has request #: ",end='')
@@ -163,88 +329,110 @@ class Scheduler:
         
         # Schedule already batched request
         else:
-            if len(self.inflight) == 0:
+            batch = self.inflight.get(batch_id)
+            if batch == None:
                 return None
-            else:
-                batch = None
-                # find batch
-                for b in self.inflight:
-                    if b.batch_id == batch_id:
-                        batch = b
-                if batch == None:
-                    return None
-                # check if this has been runned in the system
-                if sys in batch.fired:
-                    return None
-                else:
-                    batch.fired.append(sys)
-                    if self.verbose:
-                        print(f"Scheduler: scheduling exsisting batch #{batch.batch_id} to sys[{sys}]")
-                    return batch
+            # check if this has been runned in the system
+            if not batch.fire(sys):
+                return None
+            if self.verbose:
+                print(f"Scheduler: scheduling exsisting batch #{batch.batch_id} to sys[{sys}]")
+            return batch
 
     # pop inflight, add to done
     def add_done(self, id, sys, finish):
         prompt_t = 0
         gen_t = 0
         req_cnt = 0
-        if len(self.inflight) == 0:
-            return 0, 0, 0
-        batch = None
         # find batch
-        id -= 1
-        idx = 0
-        for i, b in enumerate(self.inflight):
-            if b.batch_id == id:
-                batch = b
-                idx = i
+        batch = self.inflight.get(id - 1)
         # no batch return
         if batch == None:
             return 0, 0, 0
         # already done
-        if sys in batch.end:
+        if not batch.finish(sys):
+            return 0, 0, 0
+        # check all npus are done
+        if batch.end_cnt < self.npu_num:
             return 0, 0, 0
-        else:
-            # add to done system
-            batch.end.append(sys)
-            # check all npus are done
-            for i in range(self.npu_num):
-                if i not in batch.end:
-                    return 0, 0, 0
                 
         if self.verbose:
             print(f"Scheduler: batch #{batch.batch_id} is done")
+        if batch.init_cnt == 0:
+            self.iteration_latency = finish - batch.batch_time
                 
         pool = []
         for req in batch.requests:
+            advance = 1 # generated tokens
             # change phase
             if req.is_init:
+                chunk = req.get_chunk()
+                if req.recompute:
+                    self.recomputed_tokens += chunk
+                else:
+                    prompt_t += chunk
+                req.chunk = 0
+                if self.memory.prefix_cache != None:
+                    # computed prefix blocks are shared from now on, a copy cached by another request is freed
+                    cached = req.prefix_blocks
+                    dup = self.memory.prefix_cache.insert(req, req.prefilled + chunk)
+                    self.memory.share(req, req.prefix_blocks - cached - dup, dup)
+                if req.prefilled + chunk < req.input:
+                    # chunked prefill: the rest of the prompt in the next iterations
+                    req.prefilled += chunk
+                    self.queued_prompt += req.input - req.prefilled
+                    pool.append(req)
+                    self.index[req.id] = req
+                    continue
                 req.is_init = False
-                prompt_t += req.input
+                req.prefilled = 0
                 gen_t += 1 # generated one token
-                req.set_ttft(finish)
+                if req.recompute:
+                    req.recompute = False
+                else:
+                    req.set_ttft(finish)
 
+            elif self.spec_k > 0:
+                advance = self.get_spec_advance(req)
+                gen_t += advance
+                # free kv cache reserved for draft tokens that were rejected
+                unused = self.memory.get_unused_blocks(req, advance)
+                if unused > 0:
+                    self.memory.free(req, unused)
             else:
                 gen_t += 1
 
-            req.input += 1
+            req.input += advance
             # check done
             if req.output <= req.input:
                 if self.verbose:
                     print(f"Scheduler: request #{req.id} is done")
                 # remove kv cache here
-                kv_size = self.memory.get_evict_kv(req)
-                self.memory.mem_store(kv_size)
+                self.memory.free(req)
+                if self.memory.prefix_cache != None:
+                    self.memory.prefix_cache.release(req)
+                slo_ttft, slo_tpot = req.slo_ttft, req.slo_tpot
                 req.add_latency(finish)
+                if meets_slo(req, slo_ttft, slo_tpot):
+                    self.good += 1
                 self.done.append(req)
                 req_cnt += 1
 
+            # disaggregated serving: kv cache is sent to the decode pool
+            elif self.handoff != None:
+                self.handoff.append(req)
             # return to pool
             else:
                 pool.append(req)
+                self.index[req.id] = req
         # return to request pool **at front**
-        self.request = pool + self.request
+        if self.policy.order_running:
+            for req in pool:
+                heapq.heappush(self.ready, (self.policy.key(req), req.id, req))
+        else:
+            self.ready.extendleft(reversed(pool))
 
-        del self.inflight[idx]
+        del self.inflight[batch.batch_id]
         del batch
         return prompt_t, gen_t, req_cnt
     
@@ -261,15 +449,219 @@ class Scheduler:
         return self.batch_ids
 
     # add a request
-    def add_request(self, req, is_init=True):
+    # priority: smaller is scheduled first, deadline: ns after arrival to finish the request, -1: none
+    # prefix_id: shared prefix of the prompt for prefix caching (-1: none), prefix_len: its length in tokens
+    # acceptance: probability that a draft token of the request is accepted in speculative decoding, -1: default
+    # slo_ttft, slo_tpot: service level objectives in ns, 0: none, -1: default of the scheduler
+    def add_request(self, req, is_init=True, priority=0, deadline=-1, prefix_id=-1, prefix_len=0, acceptance=-1, slo_ttft=-1, slo_tpot=-1):
         new = [self.get_req_id()]
         new_req = Request(*(new+req), is_init=is_init)
-        self.request.append(new_req)
+        new_req.prefix_id = prefix_id
+        new_req.prefix_len = prefix_len
+        new_req.priority = priority
+        new_req.acceptance = acceptance
+        new_req.slo_ttft = slo_ttft if slo_ttft >= 0 else self.slo_ttft
+        new_req.slo_tpot = slo_tpot if slo_tpot >= 0 else self.slo_tpot
+        if new_req.slo_ttft > 0 or new_req.slo_tpot > 0:
+            self.slo_requests += 1
+        new_req.deadline = new_req.arrival + deadline if deadline >= 0 else -1
+        heapq.heappush(self.pending, (new_req.arrival, new_req.id, new_req))
+        self.index[new_req.id] = new_req
         return
-    
+
+    # add a request that was prefilled by another pool, its kv cache is already in memory
+    def add_arrived(self, req):
+        heapq.heappush(self.waiting, (self.policy.key(req), req.id, req))
+        self.index[req.id] = req
+        self.queued_prompt += self.get_prompt_tokens(req)
+
+    # move arrived requests to the waiting heap of the policy
+    def admit(self, current):
+        while len(self.pending) != 0 and self.pending[0][0] <= current:
+            _, id, req = heapq.heappop(self.pending)
+            self.enqueue(req, current)
+        # deferred requests run when nothing else waits
+        while len(self.waiting) == 0 and len(self.deferred) != 0:
+            req = self.deferred.popleft()
+            heapq.heappush(self.waiting, (self.policy.key(req), req.id, req))
+            self.queued_prompt += self.get_prompt_tokens(req)
+
+    # put an arrived request in the waiting heap, unless admission control rejects or defers it
+    def enqueue(self, req, current):
+        self.index[req.id] = req
+        if self.admission != 'none' and not self.can_meet_slo(req, current):
+            if self.admission == 'reject':
+                del self.index[req.id]
+                self.rejected.append(req)
+                if self.verbose:
+                    print(f"Scheduler: request #{req.id} is rejected")
+                return
+            self.deferred.append(req)
+            self.defers += 1
+            if self.verbose:
+                print(f"Scheduler: request #{req.id} is deferred")
+            return
+        heapq.heappush(self.waiting, (self.policy.key(req), req.id, req))
+        self.queued_prompt += self.get_prompt_tokens(req)
+
+    # prompt tokens of the request left to prefill
+    def get_prompt_tokens(self, req):
+        return req.input - req.prefilled if req.is_init else 0
+
+    # estimate whether the request meets its SLO
+    # TTFT: see get_ttft_estimate, TPOT: the last decode iteration
+    def can_meet_slo(self, req, current):
+        if req.slo_ttft > 0 and self.get_ttft_estimate(req, current) > req.slo_ttft:
+            return False
+        if req.slo_tpot > 0 and self.iteration_latency > req.slo_tpot:
+            return False
+        return True
+
+    # TTFT of an arriving request: waited time + rest of the inflight batches
+    # + decode iterations until running requests free enough kv cache for the queued prompts and its own + their prefill
+    def get_ttft_estimate(self, req, current):
+        queued = self.queued_prompt + self.get_prompt_tokens(req)
+        wait = max(self.busy_until - current, 0)
+        need = self.memory.get_kv(queued) - (self.memory.npu_mem - self.memory.used_mem)
+        if need > 0:
+            # running decode requests free their blocks when they finish, the ones with fewest tokens left first
+            running = sorted((owner.output - owner.input, self.memory.get_evict_kv(owner)) for owner in self.memory.allocator.tables
+                             if owner is not self.memory.prefix_cache and not owner.is_init)
+            iterations = running[-1][0] if len(running) != 0 else 0
+            freed = 0
+            for left, size in running:
+                freed += size
+                if freed >= need:
+                    iterations = left
+                    break
+            wait += iterations * self.iteration_latency
+        return current - req.arrival + wait + self.get_prefill_latency(queued)
+
+    # get a waiting request by id, None if it is not waiting
+    def get_request(self, id):
+        return self.index.get(id)
+
+    # number of requests waiting to be batched
+    def get_num_request(self):
+        return len(self.index)
+
+    # prompt and output tokens left to process by the requests of this scheduler, including inflight ones
+    def get_outstanding_tokens(self):
+        tokens = 0
+        for req in self.index.values():
+            tokens += req.output - req.input + (req.input - req.prefilled if req.is_init else 0)
+        for batch in self.inflight.values():
+            for req in batch.requests:
+                tokens += req.output - req.input + (req.input - req.prefilled if req.is_init else 0)
+        return tokens
+
+    # reference cached prefix blocks of prompts that are not started yet, they are skipped in prefill
+    def match_prefix(self, batch_req):
+        matched = []
+        if self.memory.prefix_cache == None:
+            return matched
+        for req in batch_req:
+            if req.is_init and req.prefilled == 0 and req.prefix_id >= 0:
+                req.prefilled = self.memory.prefix_cache.acquire(req) * self.memory.block_size
+                matched.append(req)
+        return matched
+
+    # drop the prefix blocks of matched requests that are not batched
+    def unmatch_prefix(self, matched, batched):
+        for req in matched:
+            if req.id in batched:
+                self.memory.prefix_cache.commit(req)
+            else:
+                self.memory.prefix_cache.release(req)
+                req.prefilled = 0
+
+    # tokens a decode request advances in a speculative decoding iteration: accepted draft tokens + 1, up to the output
+    def get_spec_advance(self, req):
+        acceptance = req.acceptance if req.acceptance >= 0 else self.spec_acceptance
+        accepted = 0
+        while accepted < self.spec_k and self.random.random() < acceptance:
+            accepted += 1
+        self.spec_steps += 1
+        advance = min(accepted + 1, req.output - req.input)
+        self.spec_tokens += advance
+        return advance
+
+    # how to preempt the request
+    def get_preemption(self, req):
+        if self.preemption != 'auto':
+            return self.preemption
+        # swap moves the kv cache out and back in
+        swap_cost = 2 * self.memory.get_evict_kv(req) / self.remote_bw
+        if swap_cost <= self.get_prefill_latency(req.input):
+            return 'swap'
+        return 'recompute'
+
+    # estimated latency of prefilling length tokens of one request in ns, compute is split under tensor parallelism
+    def get_prefill_latency(self, length):
+        tp = self.npu_num != self.npu_group
+        head, block, tail = get_trace_layers(self.hardware, self.model, length, [length], [True], tp, self.interp, None, self.memory.kv_dtype)
+        latency = sum(layer[1] for layer in head + tail)
+        latency += sum(layer[1] for layer in block if not isinstance(layer, str)) * self.memory.n_layer
+        return latency / self.npu_num if tp else latency
+
+    # chunked prefill: decode requests take one token each (spec_k + 1 verified tokens with speculative decoding), prompts are split into chunks that fill the rest of the budget
+    # returns the requests that fit in the budget, decode requests first
+    def apply_token_budget(self, batch_req):
+        budget = self.max_num_batched_tokens
+        decode_tokens = self.spec_k + 1
+        selected = []
+        for req in batch_req:
+            if not req.is_init and budget >= decode_tokens:
+                selected.append(req)
+                budget -= decode_tokens
+        for req in batch_req:
+            if req.is_init and budget > 0:
+                req.chunk = min(req.input - req.prefilled, budget)
+                budget -= req.chunk
+                selected.append(req)
+        return selected
+
+    # largest i <= batch_len whose kv cache fits in memory and its kv_prefix[i]
+    # (default, 0) if nothing fits
+    def get_admissible_len(self, kv_prefix, batch_len, default):
+        avail = self.memory.npu_mem - self.memory.used_mem
+        i = bisect_right(kv_prefix, avail, 0, batch_len + 1) - 1
+        if i < 0:
+            return default, 0
+        return i, kv_prefix[i]
+
+    # evicted ready requests in scheduling order, generated lazily
+    # with order_running, the first kv_prefetch of them in the heap
+    def get_next_evicted(self):
+        if self.policy.order_running:
+            return (req for _, _, req in heapq.nsmallest(self.kv_store.prefetch, (item for item in self.ready if item[2].evict)))
+        return (req for req in self.ready if req.evict)
+
     # get first request's arrival time
     def get_first_arrival_time(self):
-        return self.request[0].arrival if self.request[0].arrival != 0 else 1 # need to add event handler at first
+        if len(self.ready) != 0:
+            first = self.ready[0][2].arrival if self.policy.order_running else self.ready[0].arrival
+        elif len(self.waiting) != 0:
+            first = self.waiting[0][2].arrival
+        elif len(self.deferred) != 0:
+            first = self.deferred[0].arrival
+        else:
+            first = self.pending[0][0]
+        return first if first != 0 else 1 # need to add event handler at first
+
+    # arrival time of the next request that has not arrived yet, None if there is none
+    def get_next_arrival(self):
+        return self.pending[0][0] if len(self.pending) != 0 else None
+
+    # take the next request that has not arrived yet out of the scheduler, e.g. to route it to another one
+    def pop_arrived(self):
+        _, id, req = heapq.heappop(self.pending)
+        del self.index[id]
+        return req
+
+    # check there is a request in queue that can be batched until the time
+    def has_ready_request(self, time):
+        return len(self.ready) != 0 or len(self.waiting) != 0 or len(self.deferred) != 0 or (len(self.pending) != 0 and self.pending[0][0] <= time)
 
     # print results in done
     def print_result(self):
@@ -281,13 +673,16 @@ class Scheduler:
 
     # check all the request is done
     def is_request_empty(self):
-        if len(self.request) == 0 and len(self.inflight) == 0:
+        if len(self.index) == 0 and len(self.inflight) == 0:
             return True
         else:
             return False
         
     # save requests information to an output file
-    def save_output(self, output_file):
+    # requests: requests to save, done requests by default
+    def save_output(self, output_file, requests=None):
+        if requests == None:
+            requests = self.done
         output_file = f'../{output_file}'
         with open(output_file, mode='w', newline='') as file:
             # Initialize the CSV writer
@@ -299,7 +694,7 @@ class Scheduler:
                             'queuing_delay', 'TTFT', 'TPOT'])
             
             # Write each request's information
-            for req in self.done:
+            for req in requests:
                 writer.writerow([
                     req.id,
                     req.model,
@@ -0,0 +1,91 @@
+import os
+import shutil
+import hashlib
+from collections import OrderedDict
+from .perf_model import get_perf_model
+
+# content-addressed cache of generated traces and Chakra workloads
+# entries are keyed by the signature of the batch and shared across runs
+# {path}/{key}/trace.txt, {path}/{key}/workload/llm.*.et
+class TraceCache():
+    def __init__(self, path, max_size, keep=1, verbose=False):
+        self.path = os.path.abspath(path)
+        self.max_size = max_size # bytes
+        self.keep = keep # most recently used entries that are never evicted (may still be read by inflight batches)
+        self.verbose = verbose
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.path, exist_ok=True)
+
+        # key -> size of the entry in bytes, least recently used first
+        self.entries = OrderedDict()
+        self.size = 0
+        found = []
+        for key in os.listdir(self.path):
+            entry = os.path.join(self.path, key)
+            if key.startswith('.') or not os.path.isdir(entry):
+                continue
+            found.append((os.path.getmtime(entry), key, get_dir_size(entry)))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.size += size
+
+    # signature of everything that changes the trace and the workload of the batch
+    def get_key(self, batch, hardware, npu_num, npu_group, fp, interp):
+        perf = os.stat(get_perf_model(hardware).path)
+        signature = [hardware, npu_num, npu_group, fp, interp, perf.st_size, perf.st_mtime_ns, batch.get_signature()]
+        return hashlib.sha256(repr(signature).encode()).hexdigest()[:32]
+
+    # workload path of the cached entry, None if it is not cached
+    def lookup(self, key):
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        entry = os.path.join(self.path, key)
+        os.utime(entry) # shared LRU order across runs
+        if self.verbose:
+            print(f"TraceCache: hit {key}")
+        return os.path.join(entry, "workload", "llm")
+
+    # copy generated trace and workload into the cache, returns the cached workload path
+    def store(self, key, trace_path, workload):
+        entry = os.path.join(self.path, key)
+        if key not in self.entries:
+            # copy to a temporary folder first so other runs never see a partial entry
+            tmp = os.path.join(self.path, f".{key}.{os.getpid()}")
+            shutil.rmtree(tmp, ignore_errors=True)
+            shutil.copytree(os.path.dirname(workload), os.path.join(tmp, "workload"))
+            shutil.copyfile(trace_path, os.path.join(tmp, "trace.txt"))
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                # stored by another run in the meantime
+                shutil.rmtree(tmp, ignore_errors=True)
+            size = get_dir_size(entry)
+            self.entries[key] = size
+            self.size += size
+            if self.verbose:
+                print(f"TraceCache: stored {key} ({size} bytes)")
+            self.evict()
+        self.entries.move_to_end(key)
+        return os.path.join(entry, "workload", os.path.basename(workload))
+
+    # remove least recently used entries until the cache fits in max_size
+    def evict(self):
+        while self.size > self.max_size and len(self.entries) > self.keep:
+            key, size = self.entries.popitem(last=False)
+            shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+            self.size -= size
+            if self.verbose:
+                print(f"TraceCache: evicted {key} ({size} bytes)")
+
+
+# total size of the files in the folder
+def get_dir_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            size += os.path.getsize(os.path.join(root, file))
+    return size
@@ -3,7 +3,12 @@ from time import time
 import json
 # from .request import *
 
+# model configs read in this process, keyed by model name
+_configs = {}
+
 def get_workload(batch, hardware, event=False):
+    if not event and batch.workload != None:
+        return batch.workload
     if event:
         file_name = 'event_handler'
     else:
@@ -12,6 +17,23 @@ def get_workload(batch, hardware, event=False):
     cwd = os.getcwd()
     return cwd+f"/inputs/workload/{file_name}/llm"
 
+def get_trace_path(batch, hardware):
+    return f"inputs/trace/{hardware}_{batch.model}_batch{batch.batch_id}.txt"
+
+# column widths of the trace, the misc column is always NONE in generated traces
+TRACE_WIDTHS = [33,14,12,12,12,12,12,12,12,12,12]
+NAME_WIDTH = TRACE_WIDTHS[0]
+_FIELDS_FORMAT = ''.join('{:<'+str(ileft)+'}' for ileft in TRACE_WIDTHS[1:-1]) + '{:<'+str(TRACE_WIDTHS[-1])+'}\n'
+_ROW_FORMAT = '{:<'+str(NAME_WIDTH)+'}' + _FIELDS_FORMAT
+
+# same as formatter for a hybrid row, without the per-field loop
+def format_row(Layername,comp_time='',input_loc='',input_size='',weight_loc='',weight_size='',output_loc='',output_size='',comm_type='',comm_size='',misc=''):
+    return _ROW_FORMAT.format(Layername,comp_time,input_loc,input_size,weight_loc,weight_size,output_loc,output_size,comm_type,comm_size,misc)
+
+# fields after Layername of a formatted row, misc is NONE
+def format_fields(comp_time,input_loc,input_size,weight_loc,weight_size,output_loc,output_size,comm_type,comm_size):
+    return _FIELDS_FORMAT.format(comp_time,input_loc,input_size,weight_loc,weight_size,output_loc,output_size,comm_type,comm_size,'NONE')
+
 def header():
     string_list = ["Layername","comp_time","input_loc","input_size","weight_loc","weight_size","output_loc","output_size","comm_type","comm_size","misc"]
     ileft_list = [33,14,12,12,12,12,12,12,12,12,12]
@@ -43,7 +65,10 @@ def formatter(Layername,comp_time,input_loc,input_size,weight_loc,weight_size,ou
     return output
 
 
+# config of the model, read once per process. the returned dict is shared, do not modify it
 def get_config(model_name):
+    if model_name in _configs:
+        return _configs[model_name]
 
     base_dir = os.path.dirname(os.path.abspath(__file__))
     parent_dir = os.path.dirname(base_dir)    
@@ -52,6 +77,7 @@ def get_config(model_name):
     try:
         with open(config_path, 'r', encoding='utf-8') as f:
             config = json.load(f)
+        _configs[model_name] = config
         return config
     except FileNotFoundError:
         print(f"File not found: {config_path}")
@@ -65,3 +91,7 @@ if __name__ == "__main__":
     if config:
         print(f"Loaded config for {model_name}: {list(config.keys())[:5]}")
         print(config['model_type'])
+
+# the request meets the service level objectives, ttft and tpot limits in ns, 0: no limit
+def meets_slo(req, slo_ttft, slo_tpot):
+    return (slo_ttft <= 0 or req.ttft <= slo_ttft) and (slo_tpot <= 0 or req.tpot <= slo_tpot)
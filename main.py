@@ -10,6 +10,17 @@ from inference_serving.memory_model import *
 from inference_serving.generate_graph import *
 from inference_serving.generate_trace import *
 from inference_serving.pim import *
+from inference_serving.perf_model import *
+from inference_serving.policy import POLICIES
+from inference_serving.eviction import EVICTION_POLICIES
+from inference_serving.kv_store import DEMOTION_POLICIES, PROMOTION_POLICIES
+from inference_serving.trace_cache import TraceCache
+from inference_serving.pipeline import *
+from inference_serving.analytical_engine import AnalyticalEngine
+from inference_serving.disaggregation import DisaggregatedServing
+from inference_serving.cluster import ReplicaCluster
+from inference_serving.router import ROUTERS, get_router
+from inference_serving.latency_memo import LatencyMemo
 from inference_serving.control import *
 from inference_serving.config_generator import *
 from inference_serving.request_api import RequestAPI
@@ -36,12 +47,41 @@ def main():
     parser.add_argument('--link_bw', type=int, help='bandwidth of link in GB', default=256)
     parser.add_argument('--link_latency', type=int, help='latency of link in ns', default=0)
     parser.add_argument('--fp', type=int, help='size of floating point in bit', default=16)
+    parser.add_argument('--kv_dtype', type=str, choices=list(KV_DTYPES), help='precision of the kv cache, None: same as --fp', default=None)
     parser.add_argument('--block_size', type=int, help='kv cache block size unit of tokens', default=8)
+    parser.add_argument('--policy', type=str, choices=list(POLICIES), help='scheduling policy that orders waiting requests', default='fcfs')
+    parser.add_argument('--preemption', type=str, choices=['swap', 'recompute', 'auto'], help='preemption when memory runs out, swap: kv cache to remote memory, recompute: prefill again, auto: cheaper one per request', default='swap')
+    parser.add_argument('--eviction', type=str, choices=list(EVICTION_POLICIES), help='victim of preemption: last in queue order, least recently run, largest kv cache, most remaining output, fewest bytes over remote_bw that free enough memory', default='last')
+    parser.add_argument('--host_mem', type=float, help='host memory that keeps swapped out kv cache in GB per NPU, 0: unlimited', default=0)
+    parser.add_argument('--ssd_mem', type=float, help='SSD that keeps swapped out kv cache that does not fit in the host in GB per NPU, 0: none', default=0)
+    parser.add_argument('--ssd_bw', type=int, help='bandwidth of the SSD in GB', default=4)
+    parser.add_argument('--kv_demotion', type=str, choices=DEMOTION_POLICIES, help='kv cache moved from the host to the SSD first, least recently stored or largest', default='lru')
+    parser.add_argument('--kv_promotion', type=str, choices=PROMOTION_POLICIES, help='lazy: kv cache stays in the SSD until it is loaded, eager: back to the host when it has room', default='lazy')
+    parser.add_argument('--kv_prefetch', type=int, help='next evicted requests whose kv cache is prefetched from the SSD to the host', default=2)
+    parser.add_argument('--max_num_batched_tokens', type=int, help='token budget of an iteration, prompts are prefilled in chunks, 0: no chunked prefill', default=0)
+    parser.add_argument('--prefix_caching', action='store_true', default=False, help='share kv blocks of common prompt prefixes across requests')
+    parser.add_argument('--draft_model', type=str, help='draft model of speculative decoding (in model_configs), None: off', default=None)
+    parser.add_argument('--spec_k', type=int, help='draft tokens of speculative decoding per iteration', default=4)
+    parser.add_argument('--spec_acceptance', type=float, help='probability that a draft token is accepted, per request with the optional acceptance dataset column', default=0.7)
+    parser.add_argument('--perf_interp', type=str, choices=INTERP_MODES, help='latency estimation of unprofiled (input, kv_cache) points', default='linear')
     parser.add_argument('--dataset', type=str, help='dataset path', default=None)
     parser.add_argument('--output', type=str, help='output path', default=None)
     parser.add_argument('--gen', action='store_false', default=True, help='skip initiation phase')
     parser.add_argument('--req_num', type=int, help='number of requests to use', default=100)
     parser.add_argument('--log_interval', type=float, help='interval to log throughput (sec)', default=0.5)
+    parser.add_argument('--trace_cache', type=str, help='folder of the trace & workload cache shared across runs', default=None)
+    parser.add_argument('--trace_cache_size', type=int, help='size limit of the trace cache in MB', default=4096)
+    parser.add_argument('--pipeline', action='store_true', default=False, help='prepare the predicted next batch while AnalyticalAstra runs')
+    parser.add_argument('--latency_memo', type=int, help='max # of memoized iteration latencies replayed as events, 0: off', default=0)
+    parser.add_argument('--latency_memo_bucket', type=int, help='decode kv_cache lengths are rounded up to this many tokens in the latency memo', default=1)
+    parser.add_argument('--engine', type=str, choices=['astra', 'analytical'], help='astra: run AnalyticalAstra, analytical: compute iteration latency from the perf model (npu_group 1 only)', default='astra')
+    parser.add_argument('--prefill_npu_num', type=int, help='# of NPUs of the prefill pool in disaggregated serving (analytical engine), 0: colocated', default=0)
+    parser.add_argument('--decode_npu_num', type=int, help='# of NPUs of the decode pool in disaggregated serving (analytical engine), 0: colocated', default=0)
+    parser.add_argument('--replicas', type=int, help='# of data parallel replicas of npu_num NPUs behind a router (analytical engine)', default=1)
+    parser.add_argument('--router', type=str, choices=list(ROUTERS), help='router that dispatches requests to replicas', default='round_robin')
+    parser.add_argument('--slo_ttft', type=float, help='TTFT SLO in ms of requests without the slo_ttft_ns dataset column, 0: none', default=0)
+    parser.add_argument('--slo_tpot', type=float, help='TPOT SLO in ms of requests without the slo_tpot_ns dataset column, 0: none', default=0)
+    parser.add_argument('--admission', type=str, choices=['none', 'reject', 'defer'], help='arriving requests estimated to miss their SLO, none: admit, reject: drop, defer: run when nothing else waits', default='none')
     parser.add_argument('--verbose', action='store_true', default=False, help='make verbose')
     parser.add_argument('--idle_mode', action='store_true', default=False, help='start service without generating requests')
     parser.add_argument('--http_port', type=int, help='HTTP server port for receiving requests', default=8000)
@@ -56,7 +96,17 @@ def main():
     npu_group=args.npu_group                                                # configure this to control parallelism      *if npu_group == 1: tensor parallelism, npu_num == npu_group: pipeline parallelism
     npu_mem=args.npu_mem                                                    # npu local mem (hbm) in GB     *if pim pool mode, it is size of pim and kv cache is in pim
     block_size=args.block_size                                              # kv block size of vLLM  
+    max_num_batched_tokens=args.max_num_batched_tokens                      # chunked prefill token budget, 0 means off
+    policy=args.policy
+    preemption=args.preemption
+    eviction=args.eviction
+    prefix_caching=args.prefix_caching
+    draft_model=args.draft_model                                            # speculative decoding
+    spec_k=args.spec_k
+    spec_acceptance=args.spec_acceptance
     fp=args.fp
+    kv_dtype=args.kv_dtype
+    perf_interp=args.perf_interp
     dataset=args.dataset
     output_file=args.output
     is_init=args.gen
@@ -64,23 +114,141 @@ def main():
     link_bw=args.link_bw
     link_latency = args.link_latency
     remote_bw=args.remote_bw
+    host_mem=args.host_mem                                                  # tiered kv store of swapped out kv cache
+    ssd_mem=args.ssd_mem
+    ssd_bw=args.ssd_bw
+    kv_demotion=args.kv_demotion
+    kv_promotion=args.kv_promotion
+    kv_prefetch=args.kv_prefetch
     req_num=args.req_num
     log_interval=args.log_interval
     verbose=args.verbose
     idle_mode=args.idle_mode
     http_port=args.http_port
     http_host=args.http_host
+    trace_cache_path=args.trace_cache
+    trace_cache_size=args.trace_cache_size
+    use_pipeline=args.pipeline
+    engine=args.engine
+    latency_memo_size=args.latency_memo
+    latency_memo_bucket=args.latency_memo_bucket
+    prefill_npu_num=args.prefill_npu_num                                    # disaggregated serving: NPUs of prefill and decode pools, each pool uses tensor parallelism
+    decode_npu_num=args.decode_npu_num
+    replicas=args.replicas                                                  # data parallelism: replicas of npu_num NPUs
+    router=args.router
+    slo_ttft=int(args.slo_ttft*1000000)                                     # ms -> ns
+    slo_tpot=int(args.slo_tpot*1000000)
+    admission=args.admission
+
+    # every scheduler of the simulation gets the same arguments, overrides: the ones that differ (e.g. npu_group of a pool)
+    def make_scheduler(npu_num, **overrides):
+        kwargs = dict(npu_group=npu_group, max_num_batched_tokens=max_num_batched_tokens, policy=policy, preemption=preemption, eviction=eviction,
+                      kv_dtype=kv_dtype, host_mem=host_mem, ssd_mem=ssd_mem, ssd_bw=ssd_bw, kv_demotion=kv_demotion, kv_promotion=kv_promotion,
+                      kv_prefetch=kv_prefetch, hardware=hardware, remote_bw=remote_bw, interp=perf_interp, prefix_caching=prefix_caching,
+                      draft_model=draft_model, spec_k=spec_k, spec_acceptance=spec_acceptance, slo_ttft=slo_ttft, slo_tpot=slo_tpot, admission=admission)
+        kwargs.update(overrides)
+        return Scheduler(model, max_batch, npu_num, kwargs.pop('npu_group'), npu_mem, fp, block_size, req_num, verbose, **kwargs)
+
+    if engine == 'analytical' and npu_group != 1:
+        print("ERROR: analytical engine supports single NPU or tensor parallelism only (npu_group 1)")
+        return
+
+    if draft_model != None:
+        if get_config(draft_model) == None:
+            print(f"ERROR: draft model {draft_model} has no config in model_configs")
+            return
+        if 0 < max_num_batched_tokens < spec_k + 1:
+            print(f"ERROR: max_num_batched_tokens must fit the spec_k + 1 = {spec_k + 1} tokens a decode request verifies")
+            return
+
+    # disaggregated prefill/decode serving, runs separately from the colocated simulation
+    if prefill_npu_num > 0 or decode_npu_num > 0:
+        if prefill_npu_num <= 0 or decode_npu_num <= 0 or engine != 'analytical' or idle_mode or replicas > 1:
+            print("ERROR: disaggregated serving needs both --prefill_npu_num and --decode_npu_num with --engine analytical, without idle mode and replicas")
+            return
+        prefill = make_scheduler(prefill_npu_num, npu_group=1)
+        decode = make_scheduler(decode_npu_num, npu_group=1)
+        if not prefill.memory.has_kv_room() or not decode.memory.has_kv_room():
+            return
+        serving = DisaggregatedServing(prefill, decode,
+                                       AnalyticalEngine(hardware, prefill_npu_num, 1, local_bw, remote_bw, link_bw, link_latency, perf_interp, verbose),
+                                       AnalyticalEngine(hardware, decode_npu_num, 1, local_bw, remote_bw, link_bw, link_latency, perf_interp, verbose),
+                                       link_bw, link_latency, verbose)
+        if dataset != None:
+            prefill.generate(dataset, is_init=True)
+        else:
+            for i in range(16):      # model, seq_len, end_len, arrival_time
+                prefill.add_request([model, 128, 129, 0])
+        if serving.run():
+            print("---------------------------")
+            print("Exiting The Simulator")
+            if serving.is_memory_freed():
+                print("Memory Is All Freed")
+            else:
+                print("Unfreed Memory Exists")
+        serving.print_result()
+        if output_file != None:
+            serving.save_output(output_file)
+        return
+
+    # data parallel replicas behind a router, runs separately from the single replica simulation
+    if replicas > 1:
+        if engine != 'analytical' or idle_mode:
+            print("ERROR: multiple replicas need --engine analytical, without idle mode")
+            return
+        # the front scheduler only holds requests until they arrive and are routed
+        front = make_scheduler(npu_num)
+        if not front.memory.has_kv_room():
+            return
+        schedulers = []
+        engines = []
+        for i in range(replicas):
+            schedulers.append(make_scheduler(npu_num))
+            engines.append(AnalyticalEngine(hardware, npu_num, npu_group, local_bw, remote_bw, link_bw, link_latency, perf_interp, verbose))
+        cluster = ReplicaCluster(front, schedulers, engines, get_router(router), verbose)
+        if dataset != None:
+            front.generate(dataset, is_init=is_init)
+        else:
+            for i in range(16):      # model, seq_len, end_len, arrival_time
+                front.add_request([model, 128, 129, 0])
+        if cluster.run():
+            print("---------------------------")
+            print("Exiting The Simulator")
+            if cluster.is_memory_freed():
+                print("Memory Is All Freed")
+            else:
+                print("Unfreed Memory Exists")
+        cluster.print_result()
+        if output_file != None:
+            cluster.save_output(output_file)
+        return
 
     # Automatic network, memory configuration
     # If you want to set more specific information such as latency, look at config_generator.py and each json file
-    network=create_network_config(astra_sim, npu_num, npu_group, link_bw, link_latency)
-    memory=set_remote_bandwidth(astra_sim+"/inputs/remote_memory/per_npu_memory_expansion.json", remote_bw)
+    if engine == 'astra':
+        network=create_network_config(astra_sim, npu_num, npu_group, link_bw, link_latency)
+        memory=set_remote_bandwidth(astra_sim+"/inputs/remote_memory/per_npu_memory_expansion.json", remote_bw)
     binary=astra_sim+"/build/astra_analytical/build/AnalyticalAstra/bin/AnalyticalAstra"
     system=astra_sim+"/inputs/system/system.json"
     ################################################################################################
 
-    scheduler = Scheduler(model, max_batch, npu_num, npu_group, npu_mem, fp, block_size, req_num, verbose)
+    scheduler = make_scheduler(npu_num)
+    if not scheduler.memory.has_kv_room():
+        return
     controller = Controller(npu_num, verbose)
+    trace_cache = None
+    if trace_cache_path != None:
+        trace_cache = TraceCache(os.path.join(cwd, trace_cache_path), trace_cache_size*1024*1024, npu_group, verbose)
+    analytical = None
+    if engine == 'analytical':
+        analytical = AnalyticalEngine(hardware, npu_num, npu_group, local_bw, remote_bw, link_bw, link_latency, perf_interp, verbose)
+    latency_memo = None
+    # with pipeline parallelism batches overlap, the first NPU does not measure the latency of one iteration
+    if latency_memo_size > 0 and analytical == None and npu_group == 1:
+        latency_memo = LatencyMemo(npu_num, latency_memo_size, latency_memo_bucket, verbose)
+    pipeline = None
+    if use_pipeline and analytical == None:
+        pipeline = WorkloadPipeline(hardware, npu_num, npu_group, fp, perf_interp, trace_cache, latency_memo, verbose)
     
     # Create Request API for dynamic request management
     request_api = None
@@ -128,30 +296,43 @@ def main():
     requests = 0
 
     # set Event Handler that waits until first request arrive
-    # Make Event trace
-    if idle_mode:
-        # In idle mode, create a minimal event handler
-        generate_event(1)  # Create a minimal 1ns event
+    if analytical != None:
+        # In idle mode, wake up after a minimal 1ns
+        analytical.start(1 if idle_mode else scheduler.get_first_arrival_time())
     else:
-        generate_event(scheduler.get_first_arrival_time())
-    # Make Chakra Grapth
-    generate_graph(None, hardware, npu_num, event=True)
-    # set first workload file
-    workload = get_workload(None, hardware, event=True)
-    # run subprocess
-    args = [binary, "--workload-configuration="+workload, "--system-configuration="+system, "--network-configuration="+network, "--remote-memory-configuration="+memory]
-    p = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        # Make Event trace
+        if idle_mode:
+            # In idle mode, create a minimal event handler
+            generate_event(1)  # Create a minimal 1ns event
+        else:
+            generate_event(scheduler.get_first_arrival_time())
+        # Make Chakra Grapth
+        generate_graph(None, hardware, npu_num, event=True)
+        # set first workload file
+        workload = get_workload(None, hardware, event=True)
+        # run subprocess
+        args = [binary, "--workload-configuration="+workload, "--system-configuration="+system, "--network-configuration="+network, "--remote-memory-configuration="+memory]
+        p = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
 
 
     # Starting simulation, one while loop processes one iteration
     while True:
-        out = controller.read_wait(p)
-        out_dict = controller.parse_output(out[-2])
+        if analytical != None:
+            event = analytical.wait(scheduler)
+            if event == None:
+                break
+            sys, id, current = event
+        else:
+            out = controller.read_wait(p)
+            out_dict = controller.parse_output(out[-2])
+
+            if out_dict != None:
+                sys = out_dict['sys']
+                id = out_dict['id']
+                current = out_dict['cycle']
 
-        if out_dict != None:
-            sys = out_dict['sys']
-            id = out_dict['id']
-            current = out_dict['cycle']
+            if sys == 0 and latency_memo != None:
+                latency_memo.finish(id - 1, current)
 
 
         # check request is done
@@ -165,15 +346,23 @@ def main():
 
         # schedule requests
         new_req = scheduler.schedule(current, sys, id)
+        if analytical != None:
+            analytical.submit(sys, new_req)
         # no runnable batch
-        if new_req == None:
+        elif new_req == None:
             controller.write_flush(p, "pass")
         else:
             if sys == 0:
-                generate_trace(new_req, hardware, npu_num, npu_group, fp)
-                generate_graph(new_req, hardware, npu_num)
+                prepared = pipeline != None and pipeline.take(new_req)
+                if latency_memo != None and latency_memo.replay(new_req, current):
+                    pass
+                elif not prepared:
+                    prepare_workload(new_req, hardware, npu_num, npu_group, fp, perf_interp, trace_cache)
             workload = get_workload(new_req, hardware)
             controller.write_flush(p, workload)
+            # prepare the next batch while this one runs
+            if sys == 0 and pipeline != None:
+                pipeline.prefetch(new_req, scheduler, current)
 
         # check time to store throughput
         if current > last_log + INTERVAL:
@@ -189,7 +378,8 @@ def main():
             if idle_mode:
                 # In idle mode, keep the service running and wait for new requests
                 print(f"[{current/FREQ:.3f}s] Service is idle, waiting for requests...")
-                controller.write_flush(p, "pass")  # Tell ASTRA-Sim to continue waiting
+                if analytical == None:
+                    controller.write_flush(p, "pass")  # Tell ASTRA-Sim to continue waiting
                 # You could add logic here to accept new requests dynamically
                 # For now, we'll just keep the service running
                 import time
@@ -201,13 +391,19 @@ def main():
                 print(f"[{last_log/FREQ}s] Avg Throughput: propmt: {prompt_th*RATIO}, generation: {gen_th*RATIO}")
                 print("---------------------------")
                 print("Exiting The Simulator")
+                # unreferenced prefix blocks are kept until the end
+                scheduler.memory.evict_prefix_cache(scheduler.memory.get_prefix_cache_size())
                 if scheduler.memory.weight == scheduler.memory.used_mem:
                     print("Memory Is All Freed")
                 else:
                     print("Unfreed Memory Exists")
-                controller.write_flush(p, "exit")
+                if analytical == None:
+                    controller.write_flush(p, "exit")
                 break
 
+    if pipeline != None:
+        pipeline.shutdown()
+
     # Cleanup HTTP server
     if http_server:
         try:
@@ -216,7 +412,8 @@ def main():
             print(f"Error stopping HTTP server: {e}")
 
     # check all requests are well done
-    controller.check_end(p)
+    if analytical == None:
+        controller.check_end(p)
 
     # print throughput results
     scheduler.print_result()
@@ -232,6 +429,34 @@ def main():
     print(f"Average prompt throughput: {total_prompt/total_latency:.3f} token/s")
     print(f"Average generation throughput: {total_gen/total_latency:.3f} token/s")
     print(f"Requests per second: {requests/total_latency:.3f} request/s")
+    if scheduler.swaps + scheduler.recomputes > 0:
+        fallbacks = f", {scheduler.swap_fallbacks} swaps fell back to recompute with the kv store full" if scheduler.swap_fallbacks > 0 else ""
+        print(f"Preemption: {scheduler.swaps} swapped, {scheduler.recomputes} recomputed ({scheduler.recomputed_tokens} tokens prefilled again{fallbacks})")
+        print(f"Eviction ({eviction}): {scheduler.evicted_bytes//1024//1024} MB evicted, {scheduler.loaded_bytes//1024//1024} MB reloaded, {(scheduler.evicted_bytes + scheduler.loaded_bytes)/remote_bw/1e9:.3f} s over remote_bw per NPU")
+        kv_store = scheduler.kv_store
+        if kv_store.ssd != None:
+            print(f"KV store: peak {kv_store.host.peak//1024//1024} MB in DRAM, {kv_store.ssd.peak//1024//1024} MB in SSD, {kv_store.demoted//1024//1024} MB demoted, {kv_store.promoted//1024//1024} MB promoted, {kv_store.prefetched//1024//1024} MB prefetched, {kv_store.ssd_reads//1024//1024} MB read on demand, {kv_store.stall/1e6:.3f} ms waited for the SSD per NPU")
+        else:
+            print(f"KV store: peak {kv_store.host.peak//1024//1024} MB in DRAM per NPU")
+    if scheduler.slo_requests > 0:
+        print(f"Goodput: {scheduler.good/total_latency:.3f} request/s ({scheduler.good} of {requests} requests meet the SLO)")
+    if len(scheduler.rejected) + scheduler.defers > 0:
+        print(f"Admission: {len(scheduler.rejected)} rejected, {scheduler.defers} deferred")
+    if scheduler.spec_steps > 0:
+        print(f"Speculative decoding: {scheduler.spec_tokens/scheduler.spec_steps:.3f} tokens per decode step (draft {draft_model}, k {spec_k})")
+    utilization, peak, fragmentation = scheduler.memory.get_block_stats()
+    print(f"KV blocks: {scheduler.memory.allocator.num_blocks} blocks per NPU ({scheduler.memory.kv_fp}-bit kv cache), {utilization*100:.2f}% mean / {peak*100:.2f}% peak utilization, {fragmentation*100:.2f}% internal fragmentation")
+    prefix_cache = scheduler.memory.prefix_cache
+    if prefix_cache != None:
+        hit_rate = prefix_cache.hits / prefix_cache.queries if prefix_cache.queries > 0 else 0
+        saved_mem = prefix_cache.shared_blocks * scheduler.memory.get_kv(block_size)
+        print(f"Prefix cache: {hit_rate*100:.2f}% block hit rate, {prefix_cache.saved_tokens} prefill tokens saved, {saved_mem//1024//1024} MB kv cache shared per NPU")
+    if trace_cache != None:
+        print(f"Trace cache: {trace_cache.hits} hits, {trace_cache.misses} misses")
+    if latency_memo != None:
+        print(f"Latency memo: {latency_memo.hits} hits, {latency_memo.misses} misses")
+    if pipeline != None:
+        print(f"Pipeline: {pipeline.hits} predicted batches used, {pipeline.misses} mispredicted")
     print('---------------------------')
 
     if output_file != None:
@@ -6,8 +6,12 @@ Add Qwen3-8B, OPT-6.7B and other models to all hardware performance files
 
 import csv
 import os
+import sys
 import glob
 
+sys.path.append('.')
+from inference_serving.perf_model import compile_perf_model
+
 def get_available_models():
     """Get all available model configurations"""
     models = []
@@ -31,8 +35,6 @@ def estimate_model_performance_ratio(base_model, target_model):
     
     # Load model configs to compare
     try:
-        import sys
-        sys.path.append('.')
         from inference_serving.utils import get_config
         
         base_config = get_config(base_model)
@@ -122,8 +124,8 @@ def add_model_to_perf_file(perf_file, base_model, target_model):
     print(f"   ✅ Added {len(new_rows)} entries for {target_model}")
     return True
 
-def extend_all_perf_models():
-    """Extend all performance model files to support more models"""
+def extend_all_perf_models(binary=False):
+    """Extend all performance model files to support more models, binary also compiles them to .npy"""
     
     print("🚀 Extending performance models to support more models...")
     print("=" * 60)
@@ -170,6 +172,9 @@ def extend_all_perf_models():
             except Exception as e:
                 print(f"   ❌ Error adding {target_model}: {e}")
         
+        if binary:
+            print(f"   ✅ Compiled: {compile_perf_model(perf_file)}")
+        
         print()
     
     print("=" * 60)
@@ -204,8 +209,8 @@ def show_model_support_matrix():
         print(f"Total Combinations: {len(models)} models × {len(hardware_list)} hardware = {len(models) * len(hardware_list)} configs")
 
 if __name__ == "__main__":
-    # Extend all performance models
-    extend_all_perf_models()
+    # Extend all performance models, --binary also compiles them to .npy
+    extend_all_perf_models(binary="--binary" in sys.argv)
     
     # Show support matrix
     show_model_support_matrix()
@@ -219,3 +224,6 @@ if __name__ == "__main__":
     print(f"   ")
     print(f"   # Start OpenAI server with Qwen3-8B on V100")
     print(f"   bash run_openai_server.sh --model 'qwen/Qwen3-8B' --hardware V100")
+    print(f"   ")
+    print(f"   # Compile the perf models into memory-mapped .npy files")
+    print(f"   python tools/perf_models/extend_perf_models.py --binary")
@@ -6,8 +6,12 @@ Based on known performance ratios compared to RTX3090
 
 import csv
 import os
+import sys
 
-def generate_hardware_perf_model(base_hardware="RTX3090", target_hardware="A100", performance_ratio=1.8):
+sys.path.append('.')
+from inference_serving.perf_model import compile_perf_model
+
+def generate_hardware_perf_model(base_hardware="RTX3090", target_hardware="A100", performance_ratio=1.8, binary=False):
     """
     Generate performance model for target hardware based on base hardware
     
@@ -15,6 +19,7 @@ def generate_hardware_perf_model(base_hardware="RTX3090", target_hardware="A100"
         base_hardware: Source hardware with existing performance data
         target_hardware: Target hardware to generate data for
         performance_ratio: How much faster target is compared to base (e.g., 1.8 = 80% faster)
+        binary: Also compile the memory-mappable perf_model/{target_hardware}.npy
     """
     
     base_file = f"perf_model/{base_hardware}.csv"
@@ -55,9 +60,12 @@ def generate_hardware_perf_model(base_hardware="RTX3090", target_hardware="A100"
     print(f"   Total entries: {entry_count}")
     print(f"   Models: {', '.join(models_found)}")
     
+    if binary:
+        print(f"✅ Compiled: {compile_perf_model(target_file)}")
+    
     return True
 
-def generate_all_hardware_models():
+def generate_all_hardware_models(binary=False):
     """Generate performance models for common hardware"""
     
     print("🚀 Generating performance models for common hardware...")
@@ -83,7 +91,7 @@ def generate_all_hardware_models():
     
     for hardware, ratio in hardware_ratios.items():
         try:
-            if generate_hardware_perf_model("RTX3090", hardware, ratio):
+            if generate_hardware_perf_model("RTX3090", hardware, ratio, binary):
                 success_count += 1
             print()
         except Exception as e:
@@ -135,8 +143,8 @@ def show_hardware_comparison():
         print(f"{hw:<12} {info['ratio']:<8.1f} {info['memory']:<16} {info['type']:<12} {speedup}")
 
 if __name__ == "__main__":
-    # Generate all hardware models
-    generate_all_hardware_models()
+    # Generate all hardware models, --binary also compiles them to .npy
+    generate_all_hardware_models(binary="--binary" in sys.argv)
     
     # Show comparison
     show_hardware_comparison()
@@ -145,3 +153,4 @@ if __name__ == "__main__":
     print(f"   python main.py --hardware A100 --model_name 'meta-llama/Llama-3.1-8B-Instruct'")
     print(f"   python main.py --hardware H100 --model_name 'Qwen3-8B'")
     print(f"   bash run_openai_server.sh --model 'Qwen3-8B' --hardware A100")
+    print(f"   python tools/perf_models/generate_perf_models.py --binary")
@@ -0,0 +1,61 @@
+import os
+import sys
+import random
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_serving.request import *
+from inference_serving.scheduler import Scheduler
+
+MODEL = 'facebook/opt-6.7b'
+
+def generate_dummy_requests(model, num, block_size):
+    """Generate prompts (whole or chunked), decodes and evicted decodes."""
+    reqs = []
+    for i in range(num):
+        input_size = random.randint(1, 2048)
+        req = Request(id=i, model=model, input=input_size, output=input_size + random.randint(1, 512), arrival=0)
+        kind = random.choice(['prompt', 'chunk', 'decode', 'evicted'])
+        if kind == 'chunk':
+            req.prefilled = random.randint(0, input_size - 1)
+            req.chunk = random.randint(1, input_size - req.prefilled)
+        elif kind != 'prompt':
+            req.is_init = False
+            req.evict = kind == 'evicted'
+            # decodes right before and after a block boundary
+            if random.random() < 0.5:
+                req.input = max(block_size * random.randint(1, 2048 // block_size) + random.choice([-1, 0, 1]), 1)
+        reqs.append(req)
+    return reqs
+
+def linear_admissible_len(memory, batch_req, batch_len, default):
+    """Largest admissible batch found like the scheduler did before the prefix sums."""
+    temp_len = default
+    kv_size = 0
+    for i in range(batch_len, -1, -1):
+        kv_size = memory.get_block_kv(batch_req, i)
+        if memory.mem_avail(kv_size):
+            temp_len = i
+            break
+    return temp_len, kv_size
+
+def test_admissible_len(iterations=1000):
+    random.seed(0)
+    for block_size in [1, 16]:
+        scheduler = Scheduler(MODEL, max_batch=256, npu_num=1, npu_group=1, npu_mem=24, fp=16, block_size=block_size, req_num=0)
+        memory = scheduler.memory
+        weight = memory.used_mem
+        for _ in range(iterations):
+            batch_req = generate_dummy_requests(MODEL, random.randint(0, 256), block_size)
+            batch_len = random.randint(0, len(batch_req))
+            default = random.randint(0, batch_len)
+            # from nothing to everything fitting, and over full memory
+            memory.used_mem = random.randint(weight, memory.npu_mem + memory.block_kv)
+            kv_prefix = memory.get_block_kv_prefix(batch_req)
+            expected = linear_admissible_len(memory, batch_req, batch_len, default)
+            assert scheduler.get_admissible_len(kv_prefix, batch_len, default) == expected
+        memory.used_mem = weight
+    print(f"{iterations} batches per block size match the linear search")
+
+if __name__ == "__main__":
+    test_admissible_len()
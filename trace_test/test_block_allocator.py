@@ -0,0 +1,127 @@
+import os
+import sys
+import random
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_serving.request import *
+from inference_serving.block_allocator import BlockAllocator
+from inference_serving.memory_model import MemoryModel
+
+MODEL = 'facebook/opt-6.7b'
+
+def check_allocator(allocator):
+    """Every block is either free or in exactly one table."""
+    blocks = list(allocator.free_list)
+    for table in allocator.tables.values():
+        assert len(table) != 0, "empty block table left behind"
+        blocks += table
+    assert sorted(blocks) == list(range(allocator.num_blocks))
+
+def test_allocate_release_move():
+    allocator = BlockAllocator(8, 16)
+    a, b, c = object(), object(), object()
+    assert allocator.allocate(a, 3) and allocator.allocate(b, 2)
+    assert allocator.get_table(a) == [0, 1, 2] and allocator.get_table(b) == [3, 4]
+    assert allocator.get_num_used() == 5 and allocator.get_num_free() == 3
+    # not enough free blocks: nothing is allocated
+    assert not allocator.allocate(c, 4)
+    assert allocator.get_table(c) == [] and allocator.get_num_free() == 3
+
+    # last blocks by default, first ones with front
+    assert allocator.release(a, 1) == 1 and allocator.get_table(a) == [0, 1]
+    assert allocator.release(a, 1, front=True) == 1 and allocator.get_table(a) == [1]
+    # freed blocks are reused first
+    assert allocator.allocate(c, 2) and allocator.get_table(c) == [0, 2]
+
+    # leading blocks go to the new owner, in order after its own
+    assert allocator.move(c, a, 1) == 1
+    assert allocator.get_table(a) == [1, 0] and allocator.get_table(c) == [2]
+    assert allocator.move(c, a, 5) == 1 and c not in allocator.tables
+    assert allocator.move(c, a, 1) == 0
+
+    # all blocks of the owner
+    assert allocator.release(a) == 3 and a not in allocator.tables
+    assert allocator.release(a) == 0
+    assert allocator.peak == 5
+    check_allocator(allocator)
+
+def test_random_operations(iterations=2000):
+    random.seed(0)
+    allocator = BlockAllocator(64, 16)
+    owners = [object() for _ in range(8)]
+    for _ in range(iterations):
+        owner, other = random.sample(owners, 2)
+        op = random.choice(['allocate', 'release', 'front', 'move'])
+        num = random.randint(0, 8)
+        table = list(allocator.get_table(owner))
+        if op == 'allocate':
+            num = min(num, allocator.get_num_free())
+            assert allocator.allocate(owner, num)
+            assert allocator.get_table(owner)[:len(table)] == table and len(allocator.get_table(owner)) == len(table) + num
+        elif op == 'move':
+            moved = table[:num]
+            other_table = list(allocator.get_table(other))
+            assert allocator.move(owner, other, num) == len(moved)
+            assert allocator.get_table(owner) == table[len(moved):]
+            assert allocator.get_table(other) == other_table + moved
+        else:
+            freed = allocator.release(owner, num, front=op == 'front')
+            assert freed == min(num, len(table))
+            assert allocator.get_table(owner) == (table[freed:] if op == 'front' else table[:len(table) - freed])
+        check_allocator(allocator)
+
+def test_memory_accounting(iterations=2000):
+    """used_mem of the memory model is the weight plus the used blocks."""
+    random.seed(0)
+    block_size = 16
+    memory = MemoryModel(MODEL, 1, 16, block_size, 16, prefix_caching=True)
+    reqs = []
+    for i in range(iterations):
+        op = random.choice(['batch', 'allocate', 'free', 'share'])
+        free_blocks = memory.allocator.get_num_free()
+        if op == 'batch':
+            input_size = random.randint(1, 512)
+            req = Request(id=i, model=MODEL, input=input_size, output=input_size + 1, arrival=0)
+            if memory.get_req_blocks(req) <= free_blocks:
+                memory.allocate_batch([req])
+                reqs.append(req)
+        elif op == 'allocate':
+            input_size = random.randint(2, 512)
+            req = Request(id=i, model=MODEL, input=input_size, output=input_size + 1, arrival=0, is_init=False)
+            if memory.get_evict_blocks(req) <= free_blocks:
+                memory.allocate(req)
+                reqs.append(req)
+        elif len(reqs) != 0:
+            req = random.choice(reqs)
+            num = len(memory.allocator.get_table(req))
+            if op == 'free':
+                memory.free(req, random.choice([None, random.randint(0, num)]))
+            elif num != 0:
+                shared = random.randint(0, num)
+                memory.share(req, shared, random.randint(0, num - shared))
+        assert memory.used_mem == memory.weight + memory.allocator.get_num_used() * memory.block_kv
+        check_allocator(memory.allocator)
+    for req in reqs:
+        memory.free(req)
+    memory.evict_prefix_cache(memory.get_prefix_cache_size())
+    memory.free(memory.prefix_cache)
+    assert memory.used_mem == memory.weight and memory.allocator.get_num_used() == 0
+
+def test_kv_room():
+    """Weights of the model and its draft model have to leave kv blocks."""
+    model, draft = 'meta-llama/Llama-3.1-8B-Instruct', 'meta-llama/Llama-3.2-1B-Instruct'
+    assert not MemoryModel(model, 1, 19, 16, 16, draft_model=draft).has_kv_room()
+    memory = MemoryModel(model, 1, 20, 16, 16, draft_model=draft)
+    assert memory.has_kv_room() and memory.allocator.num_blocks > 0
+    # weight over the memory
+    memory = MemoryModel(model, 1, 8, 16, 16)
+    assert memory.weight >= memory.npu_mem and not memory.has_kv_room()
+    assert MemoryModel(model, 2, 9, 16, 16).has_kv_room()
+
+if __name__ == "__main__":
+    test_allocate_release_move()
+    test_random_operations()
+    test_memory_accounting()
+    test_kv_room()
+    print("BlockAllocator tests passed")
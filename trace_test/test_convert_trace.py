@@ -0,0 +1,56 @@
+import os
+import sys
+import subprocess
+import tempfile
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_serving.generate_graph import CONVERTER_MODULE, convert_trace, get_converter
+
+TRACE_DIR = Path(__file__).parent / "inputs/trace"
+ASTRA_SIM = Path(__file__).parent.parent / "astra-sim"
+
+def run_command_line_converter(trace, workload, total_num):
+    """Convert a trace the way generate_graph did before the in-process converter."""
+    chakra = ASTRA_SIM / "extern/graph_frontend/chakra"
+    os.makedirs(os.path.dirname(workload), exist_ok=True)
+    cmd = [sys.executable, '-m', CONVERTER_MODULE, 'LLM',
+           '--input', str(trace), '--output', workload, '--num-npus', str(total_num)]
+    subprocess.run(cmd, cwd=chakra, text=True, check=True)
+
+def compare_graphs(old_dir, new_dir):
+    """Return the names of execution graphs that differ between two workload directories."""
+    old_files = sorted(p.name for p in Path(old_dir).glob("*.et"))
+    new_files = sorted(p.name for p in Path(new_dir).glob("*.et"))
+    assert old_files == new_files, f"graphs differ: {old_files} vs {new_files}"
+    assert len(old_files) != 0, "no execution graph generated"
+    return [name for name in old_files if (Path(old_dir) / name).read_bytes() != (Path(new_dir) / name).read_bytes()]
+
+def test_convert_trace(total_num=4):
+    # generate_graph runs in the astra-sim directory like main.py
+    cwd = os.getcwd()
+    if not (ASTRA_SIM / "extern/graph_frontend/chakra").is_dir():
+        print("Chakra is not checked out, skipping")
+        return
+    os.chdir(ASTRA_SIM)
+    try:
+        if get_converter() == None:
+            print("Chakra converter is not importable, skipping")
+            return
+        traces = sorted(TRACE_DIR.glob("**/*.txt"))
+        assert len(traces) != 0
+        with tempfile.TemporaryDirectory() as tmp:
+            for i, trace in enumerate(traces):
+                old_dir = os.path.join(tmp, f"old{i}")
+                new_dir = os.path.join(tmp, f"new{i}")
+                run_command_line_converter(trace, os.path.join(old_dir, "llm"), total_num)
+                convert_trace(str(trace), os.path.join(new_dir, "llm"), total_num)
+                diff = compare_graphs(old_dir, new_dir)
+                assert len(diff) == 0, f"{trace.name}: {diff} differ from the command line converter"
+                print(f"{trace.name}: {total_num} execution graphs match")
+    finally:
+        os.chdir(cwd)
+
+if __name__ == "__main__":
+    test_convert_trace()
@@ -0,0 +1,58 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_serving.request import *
+from inference_serving.kv_store import TieredKVStore
+from inference_serving.scheduler import Scheduler
+
+MODEL = 'facebook/opt-6.7b'
+
+def run_scheduler(scheduler, iteration=1000000):
+    """Run the scheduler with a fixed iteration latency on one NPU until every request is done."""
+    current = 0
+    while not scheduler.is_request_empty():
+        batch = scheduler.schedule(current, 0)
+        assert batch != None, "requests are waiting but no batch can be scheduled"
+        current += iteration
+        scheduler.add_done(batch.batch_id + 1, 0, current)
+
+def test_store_capacity():
+    # host only: 100 bytes
+    store = TieredKVStore(100, 512)
+    a, b = Request(0, MODEL, 10, 20, 0), Request(1, MODEL, 10, 20, 0)
+    assert store.store(a, 60, 0)
+    assert not store.store(b, 60, 0)
+    assert b not in store.location and store.host.used == 60 and store.host.peak == 60
+    # with an SSD, the kv cache in the host is demoted to make room
+    store = TieredKVStore(100, 512, ssd_mem=100)
+    assert store.store(a, 60, 0) and store.store(b, 60, 0)
+    assert store.location[a] is store.ssd and store.location[b] is store.host
+    assert not store.store(Request(2, MODEL, 10, 20, 0), 60, 0)
+
+def test_swap_falls_back_to_recompute():
+    results = {}
+    for host_mem in [0, 0.02]:
+        # 14 GB leave 34 kv blocks beside the weights, decodes up to 16 blocks have to be preempted
+        scheduler = Scheduler(MODEL, max_batch=16, npu_num=1, npu_group=1, npu_mem=14, fp=16, block_size=16, req_num=0,
+                              preemption='swap', host_mem=host_mem)
+        for i in range(16):
+            scheduler.add_request([MODEL, 64, 256, 0])
+        run_scheduler(scheduler)
+        store = scheduler.kv_store
+        assert len(scheduler.done) == 16
+        assert scheduler.memory.used_mem == scheduler.memory.weight
+        assert scheduler.swaps + scheduler.recomputes > 0
+        if host_mem > 0:
+            # the host never goes over its capacity, the swaps that do not fit are recomputed
+            assert store.host.peak <= store.host.capacity
+            assert scheduler.swap_fallbacks > 0 and scheduler.recomputes == scheduler.swap_fallbacks
+        else:
+            assert scheduler.swap_fallbacks == 0 and scheduler.recomputes == 0
+        results[host_mem] = (scheduler.swaps, scheduler.recomputes, store.host.peak)
+    print(f"swaps, recomputes, peak host bytes: unlimited {results[0]}, 20 MB {results[0.02]}")
+
+if __name__ == "__main__":
+    test_store_capacity()
+    test_swap_falls_back_to_recompute()
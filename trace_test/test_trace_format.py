@@ -0,0 +1,95 @@
+import os
+import re
+import sys
+import random
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_serving.request import *
+from inference_serving.utils import formatter, header, get_config, get_trace_path
+from inference_serving.generate_trace import generate_trace, get_trace_layers
+from inference_serving.perf_model import get_perf_model_path
+
+HARDWARE = "RTX3090"
+MODELS = ['meta-llama/Llama-3.1-8B-Instruct', 'facebook/opt-6.7b']
+
+def generate_dummy_batch(model, batch_id):
+    """Generate a dummy Batch of prompts and decodes, with kv cache load and eviction."""
+    batch_size = random.randint(1, 10)
+    batch = Batch(batch_id=batch_id, model=model, input=0, init_cnt=0, batch_size=batch_size, batch_time=0,
+                  kv_size=0, evict=random.choice([0, random.randint(100, 200)]),
+                  load=random.choice([0, random.randint(100, 200)]), is_orca=True)
+    for i in range(batch_size):
+        input_size = random.randint(64, 512)
+        req = Request(id=i, model=model, input=input_size, output=input_size + random.randint(64, 512),
+                      arrival=0, is_init=random.choice([True, False]))
+        batch.requests.append(req)
+        batch.input += input_size if req.is_init else 1
+        batch.init_cnt += req.is_init
+    return batch
+
+def baseline_trace(batch, npu_num, npu_group, interp='linear'):
+    """Trace of the batch written like the builder before traces were built in memory."""
+    tp = npu_num != npu_group
+    attn = [req.input for req in batch.requests]
+    init = [req.is_init for req in batch.requests]
+    head, block, tail = get_trace_layers(HARDWARE, batch.model, batch.input, attn, init, tp, interp)
+
+    # synthsize_trace: every row through formatter, the block once per decoder layer
+    def format_rows(rows):
+        lines = []
+        for row in rows:
+            if isinstance(row, str):
+                # markers were written as lines of their own
+                lines.append(row.rstrip('\n') + '\n')
+            else:
+                layer_name, latency, input_size, weight_size, output_size, comm_type, comm_size = row
+                lines.append(formatter(str(layer_name), str(latency), 'REMOTE', str(input_size), 'LOCAL', str(weight_size), 'REMOTE', str(output_size), comm_type, str(comm_size), 'NONE', 'hybrid'))
+        return lines
+    synthesized = format_rows(head) + format_rows(block) * get_config(batch.model)['num_hidden_layers'] + format_rows(tail)
+
+    # read it back, add load and evict and rewrite with the layer numbers
+    dic = [re.findall(r'\S+', line) for line in ''.join(synthesized).splitlines(keepends=True)]
+    mem = []
+    if batch.load != 0:
+        mem.append(["vllm_load_kv", '0', 'LOCAL', '0', 'REMOTE', str(batch.load), 'REMOTE', '0', 'NONE', '0', 'NONE'])
+    if batch.evict != 0:
+        mem.append(["vllm_evict_kv", '0', 'LOCAL', '0', 'REMOTE', str(batch.evict), 'REMOTE', '0', 'NONE', '0', 'NONE'])
+    result = mem + dic
+
+    output = f"ORCA\t\tmodel_parallel_NPU_group: {npu_group}\n" + str(len(result)) + '\n' + header()
+    for i in range(len(result)):
+        if "ATTENTION" not in result[i][0]:
+            output += formatter(f'{result[i][0]}_{i}', *result[i][1:], 'hybrid')
+        else:
+            output += formatter(' '.join(result[i]), '', '', '', '', '', '', '', '', '', '', 'hybrid')
+    return output
+
+def test_trace_format(iterations=10):
+    # traces and the perf model are relative to this directory, like test_gen_trace.py
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        if not os.path.exists(get_perf_model_path(HARDWARE)):
+            print(f"Perf model of {HARDWARE} not found, skipping")
+            return
+        random.seed(0)
+        for i in range(iterations):
+            # batch ids past the sample trace in inputs/trace
+            batch = generate_dummy_batch(MODELS[i % len(MODELS)], 1000 + i)
+            npu_num, npu_group = random.choice([(1, 1), (4, 1), (4, 2), (4, 4)])
+            generate_trace(batch, HARDWARE, npu_num, npu_group)
+            output_path = get_trace_path(batch, HARDWARE)
+            with open(output_path, 'r') as f:
+                trace = f.read()
+            os.remove(output_path)
+            if len(os.listdir(os.path.dirname(output_path))) == 0:
+                os.rmdir(os.path.dirname(output_path))
+            assert trace == baseline_trace(batch, npu_num, npu_group), f"batch #{batch.batch_id} differs from the baseline trace"
+        print(f"{iterations} traces match the baseline formatter")
+    finally:
+        os.chdir(cwd)
+
+if __name__ == "__main__":
+    test_trace_format()